@@ -0,0 +1,324 @@
+from __future__ import print_function  # Fix print function for python 2
+import sys        # Used for std file operations etc.
+import os         # used for path parsing and path manipulations
+import platform   # Used to get python version info
+import argparse   # Gets command line arguments and options
+import random     # Synthetic output files
+import time       # Stage timings
+import json       # Machine-readable results
+import io         # In-memory diff output
+import shutil     # Removes the generated files
+import tempfile   # Directory of the generated files
+import itertools  # Combinations of the generator parameters
+import tracemalloc  # Stage memory profiles
+try:
+    import resource  # Peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+"""
+Benchmark harness for tolDiff.py
+
+Usage can be discerned using the -h or --help option.
+
+Generates pairs of synthetic program output files like input-1.txt, numbers in
+columns of %.15E fields, with a chosen line count, column count, density of
+perturbed lines, perturbation size relative to the values and number of
+inserted and deleted blocks of lines. Each pair is run through the stages of
+tolDiff.py (read, diff, tolerance filter, write) and each stage is timed and,
+with --memory, memory-profiled with tracemalloc.
+
+The results are checked against the reference diff algorithm for pairs small
+enough for it, and the saved outputs of input-1.txt and input-2.txt are checked
+against savedOutputs. Everything is written as JSON so that runs can be
+compared over time.
+"""
+
+testsDir = os.path.dirname( os.path.abspath(__file__) )
+sys.path.insert( 0, os.path.dirname(testsDir) )
+import tolDiff
+
+
+################################
+# Begin synthetic output functions
+################################
+
+def generateValue(rng):
+    '''
+    A value like those of input-1.txt: zeros, whole numbers and general floats
+    '''
+    r = rng.random()
+    if ( r < 0.3 ): return 0.0
+    if ( r < 0.6 ): return float( rng.randrange(1, 100000) )
+    return rng.uniform(1.0, 10.0) * 10.0**rng.randrange(-8, 8)
+
+def formatValues(values):
+    return "".join( "  {:.15E}".format(value) for value in values )
+
+def generateLines(nLines, nColumns, rng):
+    '''
+    Lines of nColumns synthetic values
+    '''
+    return [ formatValues( [ generateValue(rng) for iColumn in range(nColumns) ] ) for iLine in range(nLines) ]
+
+def perturbLines(oldLines, nColumns, rng, diffDensity, perturbation, nBlocks, blockSize):
+    '''
+    Copy of oldLines with a fraction diffDensity of the lines changed by
+    scaling one nonzero value by 1 + perturbation*u, u uniform in [-1, 1], and
+    nBlocks blocks of blockSize lines inserted and nBlocks deleted
+    '''
+    newLines = list( oldLines )
+    for iLine in rng.sample( range(len(newLines)), int( diffDensity * len(newLines) ) ):
+        values = [ float(field) for field in newLines[iLine].split() ]
+        nonzero = [ iField for iField, value in enumerate(values) if value != 0.0 ]
+        if ( not nonzero ): continue
+        iField = rng.choice( nonzero )
+        values[iField] *= 1.0 + perturbation * rng.uniform(-1.0, 1.0)
+        newLines[iLine] = formatValues( values )
+    # Edit from the end so the positions of the earlier edits stay valid
+    edits = [ (rng.randrange(len(newLines)), insert) for iBlock in range(nBlocks) for insert in (True, False) ]
+    for iLine, insert in sorted( edits, reverse=True ):
+        if ( insert ):
+            newLines[iLine:iLine] = generateLines( blockSize, nColumns, rng )
+        else:
+            del newLines[iLine:iLine+blockSize]
+    return newLines
+
+def writeLines(fileName, lines):
+    with open(fileName, 'w') as f:
+        for line in lines: f.write( line + "\n" )
+
+################################
+# End synthetic output functions
+################################
+
+
+################################
+# Begin benchmark functions
+################################
+
+def runStage(case, name, function, traceMemory):
+    '''
+    Run function as stage name of case, recording its wall time and, if
+    traceMemory, the peak memory it allocated. Returns the function result.
+    '''
+    if ( traceMemory ):
+        tracemalloc.reset_peak()
+        startMemory = tracemalloc.get_traced_memory()[0]
+    startTime = time.perf_counter()
+    result = function()
+    case["seconds"][name] = time.perf_counter() - startTime
+    if ( traceMemory ): case["peakBytes"][name] = tracemalloc.get_traced_memory()[1] - startMemory
+    return result
+
+def diffOutput(oldLines, newLines, tolerances, algorithm, backend):
+    '''
+    Output of tolDiff.py for two sequences of lines, lists or LineBuffers
+    '''
+    diffFile = io.StringIO()
+    hunks = tolDiff.get_hunks( oldLines, newLines, algorithm )
+    if ( tolerances is None ):
+        tolDiff.writeDiff( diffFile, hunks, oldLines, newLines )
+    else:
+        absTol, relTol, intTol = tolerances
+        tolDiff.writeToleranceDiff( diffFile, tolDiff.toleranceFilter( hunks, oldLines, newLines, absTol, relTol, intTol, backend ),
+                                    oldLines, newLines )
+    return diffFile.getvalue()
+
+def benchmarkCase(workDir, parameters, tolerances, algorithm, backend, traceMemory, referenceMaxLines):
+    '''
+    Generate, diff and check one pair of files. Returns the case results.
+    '''
+    rng = random.Random( parameters["seed"] )
+    case = { "parameters": parameters, "seconds": {}, "peakBytes": {}, "counts": {}, "checks": {} }
+    oldLines = generateLines( parameters["lines"], parameters["columns"], rng )
+    newLines = perturbLines( oldLines, parameters["columns"], rng, parameters["diffDensity"], parameters["perturbation"],
+                             parameters["blocks"], parameters["blockSize"] )
+    oldFile = os.path.join( workDir, "old.txt" )
+    newFile = os.path.join( workDir, "new.txt" )
+    writeLines( oldFile, oldLines )
+    writeLines( newFile, newLines )
+    del oldLines, newLines
+
+    # Stages of diffFiles(), one at a time, on the same LineBuffers it reads
+    if ( traceMemory ): tracemalloc.start()
+    oldLines, newLines = runStage( case, "read", lambda: ( tolDiff.readLineBuffer(oldFile), tolDiff.readLineBuffer(newFile) ),
+                                   traceMemory )
+    hunks = runStage( case, "diff", lambda: list( tolDiff.get_hunks( oldLines, newLines, algorithm ) ), traceMemory )
+    diffFile = io.StringIO()
+    if ( tolerances is None ):
+        nWritten = runStage( case, "write", lambda: tolDiff.writeDiff( diffFile, hunks, oldLines, newLines ), traceMemory )
+    else:
+        absTol, relTol, intTol = tolerances
+        filteredHunks = runStage( case, "toleranceFilter",
+                                  lambda: list( tolDiff.toleranceFilter( hunks, oldLines, newLines, absTol, relTol, intTol, backend ) ),
+                                  traceMemory )
+        nWritten = runStage( case, "write", lambda: tolDiff.writeToleranceDiff( diffFile, filteredHunks, oldLines, newLines ), traceMemory )
+    if ( traceMemory ): tracemalloc.stop()
+    output = diffFile.getvalue()
+    case["counts"] = { "oldLines": len(oldLines), "newLines": len(newLines), "hunks": len(hunks),
+                       "hunksWritten": nWritten, "outputBytes": len(output) }
+
+    # The whole of diffFiles(), as run by main()
+    totalFile = io.StringIO()
+    runStage( case, "total", lambda: tolDiff.diffFiles( oldFile, newFile, totalFile, tolerances, algorithm, backend ), False )
+    case["checks"]["stagesMatchTotal"] = ( totalFile.getvalue() == output )
+
+    if ( len(oldLines) <= referenceMaxLines and algorithm != "reference" ):
+        case["checks"]["matchesReference"] = ( diffOutput( oldLines, newLines, tolerances, "reference", backend ) == output )
+    return case
+
+def checkSavedOutputs(algorithm, backend):
+    '''
+    Compare the output for input-1.txt and input-2.txt with the saved outputs
+    of the test commands in tolDiffTests.cmd. Returns a check for each.
+    '''
+    savedOutputs = [ ("gnuDiff.txt", tolDiff.getTolerances()),
+                     ("tolDiff-Test00.txt", tolDiff.getTolerances()),
+                     ("tolDiff-Test01.txt", tolDiff.getTolerances( defaultTolerances=True )),
+                     ("tolDiff-Test02.txt", tolDiff.getTolerances( absolute="1.e-15" )),
+                     ("tolDiff-Test03.txt", tolDiff.getTolerances( relative="1.e-16" )) ]
+    checks = {}
+    for savedName, tolerances in savedOutputs:
+        diffFile = io.StringIO()
+        tolDiff.diffFiles( os.path.join(testsDir, "input-1.txt"), os.path.join(testsDir, "input-2.txt"), diffFile,
+                           tolerances, algorithm, backend )
+        with open(os.path.join(testsDir, "savedOutputs", savedName)) as f:
+            checks[savedName] = ( diffFile.getvalue() == f.read().replace("\r", "") )
+    return checks
+
+def reportedLines(oldLines, newLines, tolerances, algorithm, backend, quantize):
+    '''
+    Sets of the indices of the old and of the new lines that tolDiff.py reports
+    as different, with the diff engine matching by quantized keys if quantize
+    '''
+    hunks = tolDiff.get_hunks( oldLines, newLines, algorithm, tolerances if quantize else None )
+    oldReported = set()
+    newReported = set()
+    for filteredHunk in tolDiff.toleranceFilter( hunks, oldLines, newLines, *tolerances, backend=backend ):
+        oldReported.update( filteredHunk.oldLines )
+        newReported.update( filteredHunk.newLines )
+    return oldReported, newReported
+
+def quantizeReportsSubset(oldLines, newLines, tolerances, algorithm, backend):
+    '''
+    True if --quantize reports no line that the default mode does not report
+    '''
+    oldQuantized, newQuantized = reportedLines( oldLines, newLines, tolerances, algorithm, backend, True )
+    oldDefault, newDefault = reportedLines( oldLines, newLines, tolerances, algorithm, backend, False )
+    return ( oldQuantized <= oldDefault and newQuantized <= newDefault )
+
+def checkPairingCases(algorithm, backend):
+    '''
+    Diff pairs of outputs whose lines all drift within the default tolerances
+    but are not where the tolerance filter expects their partners: two swapped
+    lines, and a line after an inserted block longer than the partner search
+    reach. Returns a check for each, True if only the inserted lines differ,
+    and a check that --quantize reports a subset of the default lines for
+    drifting lines between inserted blocks.
+    '''
+    rng = random.Random( 1 )
+    tolerances = tolDiff.getTolerances( defaultTolerances=True )
+    oldLines = [ formatValues( [ rng.uniform(1.0, 10.0) for iColumn in range(4) ] ) for iLine in range(200) ]    # No lines of zeros
+    newLines = [ formatValues( [ float(field) * (1.0 + 1.E-10) for field in line.split() ] ) for line in oldLines ]
+    checks = {}
+    swappedLines = list( newLines )
+    swappedLines[10], swappedLines[150] = swappedLines[150], swappedLines[10]
+    checks["swappedLines"] = ( diffOutput( oldLines, swappedLines, tolerances, algorithm, backend ) == "" )
+    insertedLines = generateLines( tolDiff.pairReachLines + 8, 4, rng )
+    shiftedLines = oldLines[:100] + insertedLines + newLines[100:101]
+    expected = diffOutput( oldLines[:101], oldLines[:100] + insertedLines + oldLines[100:101], tolerances, algorithm, backend )
+    checks["lineAfterInsertedBlock"] = ( diffOutput( oldLines[:101], shiftedLines, tolerances, algorithm, backend ) == expected )
+    if ( algorithm != "reference" ):
+        # Values drifting by up to a tenth of the tolerance, some across quantization buckets
+        rng = random.Random( 4 )
+        oldLines = [ formatValues( [ rng.uniform(1.0, 10.0) for iColumn in range(4) ] ) for iLine in range(1000) ]
+        newLines = [ formatValues( [ float(field) * (1.0 + 1.E-9 * rng.uniform(-1.0, 1.0)) for field in line.split() ] )
+                     for line in oldLines ]
+        for iBlock in range(4):
+            iLine = rng.randrange( len(newLines) )
+            newLines[iLine:iLine] = generateLines( rng.randrange(30, 100), 4, rng )
+        checks["quantizeReportsSubset"] = quantizeReportsSubset( oldLines, newLines, tolerances, algorithm, backend )
+    return checks
+
+def peakRssBytes():
+    '''
+    Peak resident set size of this process, None where it is not available
+    '''
+    if ( resource is None ): return None
+    maxRss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    return maxRss if sys.platform == "darwin" else 1024 * maxRss    # Bytes on macOS, KiB elsewhere
+
+################################
+# End benchmark functions
+################################
+
+
+################################
+# Begin main function
+################################
+def main():
+
+    ################################
+    # Parse command line arguments
+    ################################
+    parser = argparse.ArgumentParser( description="Benchmark tolDiff.py on synthetic program outputs. Lists of values run every combination." )
+    parser.add_argument( "-l","--lines", help="Numbers of lines of the old files. Default is 1000 10000 100000", nargs="+", type=int, default=[1000, 10000, 100000] )
+    parser.add_argument( "-c","--columns", help="Numbers of columns. Default is 4", nargs="+", type=int, default=[4] )
+    parser.add_argument( "-D","--diffDensity", help="Fractions of lines with a perturbed value. Default is 0.01", nargs="+", type=float, default=[0.01] )
+    parser.add_argument( "-p","--perturbation", help="Relative sizes of the perturbations. Default is 1.E-9 1.E-7, either side of the default relative tolerance", nargs="+", type=float, default=[1.E-9, 1.E-7] )
+    parser.add_argument( "-B","--blocks", help="Number of blocks inserted and of blocks deleted. Default is 2", action="store", type=int, default=2 )
+    parser.add_argument( "-k","--blockSize", help="Lines per inserted or deleted block. Default is 10", action="store", type=int, default=10 )
+    parser.add_argument( "-t","--defaultTolerances", help="Sets default absolute and relative tolerances to 1.E-15 and 1.E-8, respectively", action="store_true" )
+    parser.add_argument( "-a","--absolute", help="Absolute tolerance value, overrides default tolerances", action="store" )
+    parser.add_argument( "-r","--relative", help="Relative tolerance value, overrides default tolerances", action="store" )
+    parser.add_argument( "-i","--integers", help="Flag indicating integers are also checked", action="store_true" )
+    parser.add_argument( "-g","--algorithm", help="Diff algorithm. Default is myers", choices=sorted(tolDiff.diffAlgorithms), default="myers" )
+    parser.add_argument( "-b","--backend", help="Tolerance comparison backend. Default is auto", choices=["auto","numpy","python"], default="auto" )
+    parser.add_argument( "-m","--memory", help="Profile the peak memory of each stage with tracemalloc, which slows the stages down", action="store_true" )
+    parser.add_argument( "-R","--referenceMaxLines", help="Largest files checked against the slow reference algorithm. Default is 5000", action="store", type=int, default=5000 )
+    parser.add_argument( "-s","--seed", help="Random seed of the generator. Default is 1", action="store", type=int, default=1 )
+    parser.add_argument( "-f","--file", help="Name of the JSON output file. Default is stdout", action="store" )
+    args = parser.parse_args()
+
+    tolerances = tolDiff.getTolerances( args.defaultTolerances, args.absolute, args.relative, args.integers )
+    results = { "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": tolDiff.numpy is not None,
+                "started": time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+                "algorithm": args.algorithm,
+                "backend": args.backend,
+                "tolerances": tolerances,
+                "savedOutputs": checkSavedOutputs( args.algorithm, args.backend ),
+                "pairingCases": checkPairingCases( args.algorithm, args.backend ),
+                "cases": [] }
+
+    workDir = tempfile.mkdtemp( prefix="tolDiffBenchmark" )
+    try:
+        for nLines, nColumns, diffDensity, perturbation in itertools.product( args.lines, args.columns, args.diffDensity, args.perturbation ):
+            parameters = { "lines": nLines, "columns": nColumns, "diffDensity": diffDensity, "perturbation": perturbation,
+                           "blocks": args.blocks, "blockSize": args.blockSize, "seed": args.seed }
+            case = benchmarkCase( workDir, parameters, tolerances, args.algorithm, args.backend, args.memory, args.referenceMaxLines )
+            results["cases"].append( case )
+            sys.stderr.write( "{:s}: {:.3f} s\n".format( json.dumps(parameters), case["seconds"]["total"] ) )
+    finally:
+        shutil.rmtree( workDir )
+    results["peakRssBytes"] = peakRssBytes()
+
+    if ( args.file ):
+        with open(args.file, 'w') as f:
+            json.dump( results, f, indent=2 )
+    else:
+        json.dump( results, sys.stdout, indent=2 )
+        sys.stdout.write( "\n" )
+
+    # Exit status 1 if any check failed
+    checks = list( results["savedOutputs"].values() ) + list( results["pairingCases"].values() ) + [ ok for case in results["cases"] for ok in case["checks"].values() ]
+    exit( 0 if all(checks) else 1 )
+
+################################
+# End of main function
+################################
+
+# Invoke main function if running script standalone
+if ( __name__ == "__main__" ): main()
@@ -11,3 +11,15 @@ python ..\tolDiff.py --absolute 1.e-15 -f tolDiff-Test02.txt input-1.txt input-2
 
 :: Test 03 - relative tolerance
 python ..\tolDiff.py --relative 1.e-16 -f tolDiff-Test03.txt input-1.txt input-2.txt
+
+:: Test 04 - no tolerances, patience algorithm, compare to savedOutputs\tolDiff-Test00.txt
+python ..\tolDiff.py --algorithm patience -f tolDiff-Test04.txt input-1.txt input-2.txt
+
+:: Test 05 - no tolerances, reference algorithm, compare to savedOutputs\tolDiff-Test00.txt
+python ..\tolDiff.py --algorithm reference -f tolDiff-Test05.txt input-1.txt input-2.txt
+
+:: Test 06 - no tolerances, hunt algorithm, compare to savedOutputs\tolDiff-Test00.txt
+python ..\tolDiff.py --algorithm hunt -f tolDiff-Test06.txt input-1.txt input-2.txt
+
+:: Benchmark - synthetic outputs, checks savedOutputs and the reference algorithm, results in tolDiffBenchmark.json
+python tolDiffBenchmark.py --defaultTolerances -f tolDiffBenchmark.json
@@ -5,6 +5,43 @@ import platform   # Used to get python version info
 import argparse   # Gets command line arguments and options
 import re         # Used for replacing optics files path in NORSE input
 import math       # Needed for math.isclose()
+import collections  # namedtuple for parsed diff lines
+import array      # Compact integer arrays of interned lines
+import bisect     # Binary search in the diff algorithms
+import operator   # Picks the numeric fields of lines for the NumPy backend
+import io         # In-memory output of the parallel diff segments
+import multiprocessing  # Process pool for --jobs and batch mode
+import shlex      # Splits the lines of batch manifest files
+import json       # Requests and responses of the server mode
+import socket     # Unix socket of the server mode
+import socketserver  # Server mode
+import signal     # Clean shutdown of the server mode
+import mmap       # Zero-copy reading of the input files
+import itertools  # Line by line comparison in brief mode
+import locale     # Encoding of the lines written out
+import time       # Phase timings of --stats
+import stat       # Checks that an existing server socket path is a socket
+import gzip       # Compressed input and output files
+import zlib       # Errors of corrupt gzip files
+try:
+    import numpy  # Optional, vectorized tolerance comparisons
+except ImportError:
+    numpy = None
+try:
+    import resource  # Peak RSS for --stats, not available on Windows
+except ImportError:
+    resource = None
+try:
+    import bz2    # Compressed files, not built into every Python
+except ImportError:
+    bz2 = None
+try:
+    import lzma   # Compressed files, not built into every Python
+except ImportError:
+    lzma = None
+
+debug = False     # Set by main(), also read by the worker processes
+stats = None      # RunStats set by main() with --stats, None when disabled
 
 """
 Written (mostly) by Thomas W. Laub
@@ -27,17 +64,17 @@ by whitespace Hence the whitespace is ignored.
 
 
 ################################
-# Begin Hunt–McIlroy diff algorithm functions
+# Begin reference diff algorithm functions
 ################################
 '''
-The next three functions were written by Joren Dorff at the
+The next two functions were written by Joren Dorff at the
 URL: https://gist.github.com/jorendorff/5040491
-It is an implementation of the Hunt–McIlroy algorithm and is explained here:
-http://pynash.org/2013/02/26/diff-in-50-lines.html as a primitive `diff` in
-50 lines of Python.
+It is explained here: http://pynash.org/2013/02/26/diff-in-50-lines.html
+as a primitive `diff` in 50 lines of Python.
 
-I have modified it so that the output matches the output of GNU diff in format
-and returned the results in a list instead of printing them.
+They scan every (i, j) pair of the current window, so the cost is roughly
+cubic in the worst case. They are kept as the "reference" algorithm for
+output-equivalence checks against the faster engines below.
 '''
 
 def longest_matching_slice(a, a0, a1, b, b0, b1):
@@ -64,99 +101,2080 @@ def matching_slices(a, a0, a1, b, b0, b1):
             [(sa, sb, n)] +
             matching_slices(a, sa+n, a1, b, sb+n, b1))
 
-def get_diff(a, b):
+################################
+# End reference diff algorithm functions
+################################
+
+
+################################
+# Begin Myers and patience diff algorithm functions
+################################
+'''
+Linear-space Myers O(ND) diff (E. Myers, "An O(ND) Difference Algorithm and
+Its Variations", Algorithmica 1986) and patience diff (B. Cohen). Both return
+the same list of matching slices (sa, sb, n) as matching_slices() so that
+get_diff() can format any of them. Recursion is replaced by an explicit
+stack so very long files do not hit the interpreter recursion limit.
+'''
+
+def middle_snake(a, a0, a1, b, b0, b1):
     '''
-    a and b are lists of the two files to be diffed (with any newlines removed)
+    Find the middle snake of an optimal edit path between a[a0:a1] and
+    b[b0:b1]. Returns the start and end points (x, y, u, v) of the snake.
     '''
-    diffList = []
-    ia = ib = 0
-    slices = matching_slices(a, 0, len(a), b, 0, len(b))
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = ( delta % 2 == 1 )
+    maxD = (n + m + 1) // 2
+    offset = maxD + 1
+    vf = [0] * (2*offset + 1)
+    vb = [0] * (2*offset + 1)
+    for d in range(maxD + 1):
+        # Forward search from the top left corner
+        for k in range(-d, d+1, 2):
+            if ( k == -d or (k != d and vf[offset+k-1] < vf[offset+k+1]) ):
+                x = vf[offset+k+1]
+            else:
+                x = vf[offset+k-1] + 1
+            y = x - k
+            xs, ys = x, y
+            while ( x < n and y < m and a[a0+x] == b[b0+y] ):
+                x += 1
+                y += 1
+            vf[offset+k] = x
+            if ( odd and (delta - (d-1)) <= k <= (delta + (d-1)) ):
+                if ( x + vb[offset+delta-k] >= n ):
+                    return a0+xs, b0+ys, a0+x, b0+y
+        # Reverse search from the bottom right corner
+        for k in range(-d, d+1, 2):
+            if ( k == -d or (k != d and vb[offset+k-1] < vb[offset+k+1]) ):
+                x = vb[offset+k+1]
+            else:
+                x = vb[offset+k-1] + 1
+            y = x - k
+            xs, ys = x, y
+            while ( x < n and y < m and a[a1-1-x] == b[b1-1-y] ):
+                x += 1
+                y += 1
+            vb[offset+k] = x
+            if ( not odd and -d <= (delta - k) <= d ):
+                if ( x + vf[offset+delta-k] >= n ):
+                    return a1-x, b1-y, a1-xs, b1-ys
+    raise RuntimeError( "middle_snake: no overlap found" )
+
+def merge_slices(slices):
+    '''
+    Sort matching slices and merge the ones that are contiguous
+    '''
+    merged = []
+    for sa, sb, n in sorted(slices):
+        if ( n == 0 ): continue
+        if ( merged and merged[-1][0] + merged[-1][2] == sa and merged[-1][1] + merged[-1][2] == sb ):
+            merged[-1] = ( merged[-1][0], merged[-1][1], merged[-1][2] + n )
+        else:
+            merged.append( (sa, sb, n) )
+    return merged
+
+def myers_slices(a, a0, a1, b, b0, b1):
+    '''
+    Matching slices of a[a0:a1] and b[b0:b1] from the linear-space Myers diff
+    '''
+    slices = []
+    stack = [ (a0, a1, b0, b1) ]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        # Strip the common prefix and suffix of this window
+        n = 0
+        while ( a0+n < a1 and b0+n < b1 and a[a0+n] == b[b0+n] ): n += 1
+        slices.append( (a0, b0, n) )
+        a0 += n
+        b0 += n
+        n = 0
+        while ( a1-n > a0 and b1-n > b0 and a[a1-1-n] == b[b1-1-n] ): n += 1
+        slices.append( (a1-n, b1-n, n) )
+        a1 -= n
+        b1 -= n
+        if ( a0 == a1 or b0 == b1 ): continue
+        x, y, u, v = middle_snake(a, a0, a1, b, b0, b1)
+        slices.append( (x, y, u-x) )
+        stack.append( (u, a1, v, b1) )
+        stack.append( (a0, x, b0, y) )
+    return merge_slices(slices)
+
+def unique_common_lines(a, a0, a1, b, b0, b1):
+    '''
+    (i, j) pairs of lines occurring exactly once in both a[a0:a1] and b[b0:b1],
+    in order of i
+    '''
+    countA = {}
+    for i in range(a0, a1):
+        line = a[i]
+        countA[line] = -1 if line in countA else i
+    countB = {}
+    for j in range(b0, b1):
+        line = b[j]
+        if ( countA.get(line, -1) < 0 ): continue
+        countB[line] = -1 if line in countB else j
+    return sorted( (countA[line], j) for line, j in countB.items() if j >= 0 )
+
+def longest_increasing_pairs(pairs):
+    '''
+    Patience sort: longest subsequence of pairs that increases in j
+    '''
+    tails = []      # index into pairs of the smallest tail of each pile
+    backPtr = []
+    tailJ = []
+    for iPair, (i, j) in enumerate(pairs):
+        lo = bisect.bisect_left( tailJ, j )
+        backPtr.append( tails[lo-1] if lo > 0 else -1 )
+        if ( lo == len(tails) ):
+            tails.append( iPair )
+            tailJ.append( j )
+        else:
+            tails[lo] = iPair
+            tailJ[lo] = j
+    result = []
+    iPair = tails[-1] if tails else -1
+    while iPair >= 0:
+        result.append( pairs[iPair] )
+        iPair = backPtr[iPair]
+    result.reverse()
+    return result
+
+def patience_slices(a, a0, a1, b, b0, b1):
+    '''
+    Matching slices of a[a0:a1] and b[b0:b1] from patience diff. Windows
+    without unique common lines fall back to the Myers diff.
+    '''
+    slices = []
+    stack = [ (a0, a1, b0, b1) ]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        if ( a0 == a1 or b0 == b1 ): continue
+        anchors = longest_increasing_pairs( unique_common_lines(a, a0, a1, b, b0, b1) )
+        if ( not anchors ):
+            slices.extend( myers_slices(a, a0, a1, b, b0, b1) )
+            continue
+        # Windows between consecutive anchors are diffed independently
+        i0, j0 = a0, b0
+        for i, j in anchors:
+            stack.append( (i0, i, j0, j) )
+            slices.append( (i, j, 1) )
+            i0, j0 = i + 1, j + 1
+        stack.append( (i0, a1, j0, b1) )
+    return merge_slices(slices)
+
+################################
+# End Myers and patience diff algorithm functions
+################################
+
+
+################################
+# Begin Hunt–McIlroy diff algorithm functions
+################################
+'''
+Lines are hashed and interned into integer IDs before diffing, so the engines
+compare ints instead of strings. Lines found in only one file are dropped up
+front since they can never match. hunt_slices() is the k-candidates method of
+J. W. Hunt and M. D. McIlroy, "An Algorithm for Differential File Comparison",
+1976. It only visits the equal (i, j) pairs found in the occurrence index.
+'''
+
+def intern_lines(a, a0, a1, b, b0, b1):
+    '''
+    Intern the lines of a[a0:a1] and b[b0:b1] into integer IDs. Returns the ID
+    arrays of the lines found in both and the positions of those lines in a and b.
+    '''
+    lineIds = {}
+    bLineIds = array.array( 'l' )
+    for line in iterLines( b, b0, b1 ):
+        bLineIds.append( lineIds.setdefault( line, len(lineIds) ) )
+    nIdsB = len(lineIds)
+    inA = bytearray( nIdsB )
+    aIds = array.array( 'l' )
+    aPos = array.array( 'l' )
+    for i, line in enumerate( iterLines( a, a0, a1 ), a0 ):
+        lineId = lineIds.get( line, nIdsB )
+        if ( lineId == nIdsB ): continue    # Not in b
+        inA[lineId] = 1
+        aIds.append( lineId )
+        aPos.append( i )
+    bIds = array.array( 'l' )
+    bPos = array.array( 'l' )
+    for j, lineId in enumerate( bLineIds, b0 ):
+        if ( not inA[lineId] ): continue    # Not in a
+        bIds.append( lineId )
+        bPos.append( j )
+    return aIds, aPos, bIds, bPos
+
+def remap_slices(slices, aPos, bPos):
+    '''
+    Map matching slices of the interned arrays back to the original line numbers
+    '''
+    remapped = []
     for sa, sb, n in slices:
-        if ( ia == (sa-1) ):
-            diffList.append( "{:d}c{:d}".format((ia+1),(ib+1)) )
+        for t in range(n):
+            remapped.append( (aPos[sa+t], bPos[sb+t], 1) )
+    return merge_slices( remapped )
+
+def hunt_slices(a, a0, a1, b, b0, b1):
+    '''
+    Matching slices of a[a0:a1] and b[b0:b1] from the Hunt–McIlroy algorithm
+    '''
+    # Occurrence index: line ID -> sorted positions in b
+    positions = {}
+    for j in range(b0, b1):
+        positions.setdefault( b[j], [] ).append( j )
+
+    # thresh[k] is the smallest j ending a common subsequence of length k+1,
+    # links[k] is the candidate chain (i, j, previous) that achieves it
+    thresh = []
+    links = []
+    for i in range(a0, a1):
+        occurrences = positions.get( a[i] )
+        if ( not occurrences ): continue
+        for j in reversed(occurrences):
+            k = bisect.bisect_left( thresh, j )
+            if ( k == len(thresh) ):
+                thresh.append( j )
+                links.append( (i, j, links[k-1] if k > 0 else None) )
+            elif ( j < thresh[k] ):
+                thresh[k] = j
+                links[k] = (i, j, links[k-1] if k > 0 else None)
+
+    slices = []
+    link = links[-1] if links else None
+    while link is not None:
+        slices.append( (link[0], link[1], 1) )
+        link = link[2]
+    return merge_slices( slices )
+
+################################
+# End Hunt–McIlroy diff algorithm functions
+################################
+
+
+################################
+# Begin line storage functions
+################################
+'''
+Files are read once, in binary mode, and kept as a LineBuffer: the file bytes,
+memory-mapped where possible, and the start and end offsets of each line in
+two compact arrays, instead of one Python string per line. The diff engines and
+the field parsing work on the lines as bytes. Only the lines written out are
+decoded, with the encoding text mode would have used. Lines end with \n or
+\r\n, neither of which is part of the line.
+'''
+
+textEncoding = locale.getpreferredencoding( False )
+
+class LineBuffer(object):
+    '''
+    Sequence of the lines of data, a bytes-like buffer, as bytes without their
+    line ends. Slicing returns a list of lines. The lines are found in data
+    unless their starts and ends are given.
+
+    Line i is data[starts[i]:ends[i]]. For files with only \n line ends, ends
+    is None and line i is data[starts[i]:starts[i+1]-1], so that one array
+    holds the offsets.
+    '''
+    chunkBytes = 1 << 20
+
+    def __init__(self, data, starts=None, ends=None):
+        self.data = data
+        self.starts = starts
+        self.ends = ends
+        if ( starts is None ): self.findLines()
+
+    def findLines(self):
+        '''
+        Find the starts, and if there are \r\n line ends the ends, of the lines.
+        The buffer is split a chunk at a time so that the lines are only
+        counted in C and not kept.
+        '''
+        data = self.data
+        nBytes = len(data)
+        self.starts = array.array( 'q', [0] )
+        start = 0
+        while ( start < nBytes ):
+            stop = data.find( b"\n", min( start + self.chunkBytes, nBytes ) - 1 ) + 1 or nBytes
+            lengths = map( len, io.BytesIO( data[start:stop] ).readlines() )
+            self.starts.extend( itertools.islice( itertools.accumulate( lengths, initial=start ), 1, None ) )
+            start = stop
+        if ( nBytes > 0 and data[nBytes-1] != 10 ): self.starts[-1] += 1    # As if the last line ended with \n
+        if ( data.find( b"\r" ) >= 0 ):
+            self.ends = array.array( 'q', ( stop - 2 if data[stop-2:stop-1] == b"\r" else stop - 1
+                                            for stop in itertools.islice( self.starts, 1, None ) ) )
+
+    def __len__(self):
+        return len(self.starts) - 1 if self.ends is None else len(self.ends)
+
+    def __getitem__(self, i):
+        if ( isinstance(i, slice) ): return list( self.iterRange( *i.indices( len(self) )[:2] ) )
+        if ( self.ends is None ): return self.data[self.starts[i]:self.starts[i+1]-1]
+        return self.data[self.starts[i]:self.ends[i]]
+
+    def iterRange(self, start, stop):
+        '''
+        Iterate over lines start to stop, faster than indexing them one by one
+        '''
+        starts = itertools.islice( self.starts, start, stop )
+        if ( self.ends is None ):
+            ends = map( (-1).__add__, itertools.islice( self.starts, start + 1, stop + 1 ) )
         else:
-            diffList.append( "{:d},{:d}c{:d},{:d}".format((ia+1),sa,(ib+1),sb) )
-        for line in a[ia:sa]:
-            diffList.append ( "< " + line )
-        diffList.append ( "---" )
-        for line in b[ib:sb]:
-            diffList.append ( "> " + line )
+            ends = itertools.islice( self.ends, start, stop )
+        return map( self.data.__getitem__, map( slice, starts, ends ) )
+
+def iterLines(lines, start, stop):
+    '''
+    Iterate over lines[start:stop] of a list or a LineBuffer without copying it
+    '''
+    if ( isinstance(lines, LineBuffer) ): return lines.iterRange( start, stop )
+    return itertools.islice( lines, start, stop )
+
+def readLineBuffer(fileName):
+    '''
+    LineBuffer of the file fileName, memory-mapped unless it is empty, cannot
+    be mapped or is compressed. The file is opened once, so it may be a pipe.
+    '''
+    with openInput(fileName) as f:
+        if ( isinstance(f, CompressedInput) ): return LineBuffer( readDecompressed( f ) )
+        try:
+            data = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+        except (ValueError, OSError):
+            data = f.read()
+    return LineBuffer( data )
+
+def readDecompressed(f, chunkBytes=LineBuffer.chunkBytes):
+    '''
+    The decompressed bytes of the CompressedInput f. It is decompressed a
+    chunk at a time into one growing buffer, which is returned without copying
+    it, so there is neither a temporary file nor a second copy. The whole
+    decompressed file is held in memory, only stream mode bounds it.
+    '''
+    buffer = io.BytesIO()
+    for chunk in iter( lambda: f.read( chunkBytes ), b"" ):
+        buffer.write( chunk )
+    return buffer.getvalue()
+
+def stripLineEnd(line):
+    '''
+    A line read in binary mode without its \n or \r\n line end
+    '''
+    if ( line.endswith(b"\n") ): line = line[:-1]
+    if ( line.endswith(b"\r") ): line = line[:-1]
+    return line
+
+def lineText(line):
+    '''
+    A line as text for writing out, decoding it if it is bytes
+    '''
+    if ( isinstance(line, bytes) ): return line.decode( textEncoding, "replace" )
+    return line
+
+################################
+# End line storage functions
+################################
+
+
+################################
+# Begin compressed file functions
+################################
+'''
+OldFile and NewFile may be gzip, bzip2 or xz compressed, which is recognized by
+their first bytes rather than their names. They are decompressed as they are
+read. The diff file is written compressed if its name ends with .gz, .bz2 or .xz.
+'''
+
+compressionFormats = ( (b"\x1f\x8b", "gzip", gzip),
+                       (b"BZh", "bzip2", bz2),
+                       (b"\xfd7zXZ\x00", "xz", lzma) )
+compressionSuffixes = { ".gz": gzip, ".bz2": bz2, ".xz": lzma }
+compressionErrors = ( (EOFError, zlib.error) + ( (gzip.BadGzipFile,) if hasattr(gzip, "BadGzipFile") else () ) +
+                      ( (lzma.LZMAError,) if lzma is not None else () ) )
+
+def compressionModule(fileName, magic):
+    '''
+    Module that decompresses fileName, starting with the bytes magic, None if
+    it is not compressed
+    '''
+    for prefix, name, module in compressionFormats:
+        if ( not magic.startswith(prefix) ): continue
+        if ( module is None ):
+            raise IOError( "{:s} is {:s} compressed, which this Python does not support".format( fileName, name ) )
+        return module
+    return None
+
+def openInput(fileName):
+    '''
+    Binary file object of the lines of fileName, decompressing it as it is
+    read if it is compressed. The file is opened once and its first bytes are
+    peeked at, not read, so that pipes work too.
+    '''
+    f = open(fileName, "rb")
+    try:
+        module = compressionModule( fileName, f.peek( 6 )[:6] )
+    except IOError:
+        f.close()
+        raise
+    if ( module is None ): return f
+    return CompressedInput( fileName, module, f )
+
+class CompressedInput(object):
+    '''
+    Binary file object decompressing the open file f of fileName with module,
+    that raises IOError naming the file for corrupt data rather than the
+    errors of module
+    '''
+    def __init__(self, fileName, module, f):
+        self.fileName = fileName
+        self.compressed = f
+        self.f = module.open(f, "rb")
+
+    def corrupt(self, error):
+        return IOError( "{:s}: corrupt compressed file: {:s}".format( self.fileName, str(error) ) )
+
+    def read(self, size=-1):
+        try:
+            return self.f.read( size )
+        except compressionErrors as error:
+            raise self.corrupt( error )
+
+    def readline(self):
+        try:
+            return self.f.readline()
+        except compressionErrors as error:
+            raise self.corrupt( error )
+
+    def __iter__(self):
+        return iter( self.readline, b"" )
+
+    def close(self):
+        self.f.close()
+        self.compressed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def openOutput(fileName):
+    '''
+    Text file object writing to fileName, compressed if its name ends with the
+    suffix of a compression format
+    '''
+    suffix = os.path.splitext(fileName)[1].lower()
+    if ( suffix not in compressionSuffixes ): return open(fileName, "w")
+    if ( compressionSuffixes[suffix] is None ):
+        raise IOError( "{:s} files are not supported by this Python".format( suffix ) )
+    return compressionSuffixes[suffix].open(fileName, "wt")
+
+################################
+# End compressed file functions
+################################
+
+
+################################
+# Begin identical file and common prefix/suffix functions
+################################
+
+def files_identical(oldFile, newFile, chunkSize=1<<20):
+    '''
+    True if the two files are byte-identical. Compares sizes first, then chunks.
+    False unless both are regular files: pipes, as from process substitution,
+    can only be read once, by the diff.
+    '''
+    oldStat = os.stat( oldFile )
+    newStat = os.stat( newFile )
+    if ( not (stat.S_ISREG(oldStat.st_mode) and stat.S_ISREG(newStat.st_mode)) ): return False
+    if ( oldStat.st_size != newStat.st_size ): return False
+    with open(oldFile, "rb") as oldf, open(newFile, "rb") as newf:
+        while True:
+            oldChunk = oldf.read( chunkSize )
+            if ( oldChunk != newf.read( chunkSize ) ): return False
+            if ( not oldChunk ): return True
+
+def common_prefix_length(a, b, blockSize=1024):
+    '''
+    Number of leading lines that are equal in a and b. Whole blocks are
+    compared as list slices first so most of the work is done in C.
+    '''
+    n = min( len(a), len(b) )
+    i = 0
+    while ( i + blockSize <= n and a[i:i+blockSize] == b[i:i+blockSize] ):
+        i += blockSize
+    while ( i < n and a[i] == b[i] ):
+        i += 1
+    return i
+
+def common_suffix_length(a, b, nPrefix, blockSize=1024):
+    '''
+    Number of trailing lines that are equal in a and b, not overlapping the
+    nPrefix leading lines already matched
+    '''
+    n = min( len(a), len(b) ) - nPrefix
+    na = len(a)
+    nb = len(b)
+    i = 0
+    while ( i + blockSize <= n and a[na-i-blockSize:na-i] == b[nb-i-blockSize:nb-i] ):
+        i += blockSize
+    while ( i < n and a[na-i-1] == b[nb-i-1] ):
+        i += 1
+    return i
+
+################################
+# End identical file and common prefix/suffix functions
+################################
+
+
+################################
+# Begin run statistics functions
+################################
+'''
+With --stats the wall time of each phase of a run and a few counters are kept
+in the global RunStats stats and written as JSON at the end. Everything is
+recorded per window, hunk or section, never per line or field, and only when
+stats is not None, so a run without --stats pays nothing for it. Worker
+processes keep their own RunStats and send them back to be merged, so their
+phase times are summed over the processes.
+'''
+
+statsPhases = ( "read", "intern", "diff", "toleranceFilter", "write" )
+statsCounts = ( "oldLines", "newLines", "linesIgnored", "hunks", "hunksSuppressed", "linesCompared",
+                "fieldsParsed", "iscloseEvaluations" )
+
+class RunStats(object):
+    '''
+    Wall time per phase and counters of a run. Phases nest: the time spent in
+    an inner phase is not charged to the outer one.
+    '''
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.seconds = collections.Counter( dict.fromkeys( statsPhases, 0.0 ) )
+        self.counts = collections.Counter( dict.fromkeys( statsCounts, 0 ) )
+        self.phases = []
+        self.phaseStart = self.startTime
+
+    def start(self, phase):
+        now = time.perf_counter()
+        if ( self.phases ): self.seconds[self.phases[-1]] += now - self.phaseStart
+        self.phases.append( phase )
+        self.phaseStart = now
+
+    def stop(self):
+        now = time.perf_counter()
+        self.seconds[self.phases.pop()] += now - self.phaseStart
+        self.phaseStart = now
+
+    def merge(self, other):
+        '''
+        Add the seconds and counts of other, the asDict() of a worker's RunStats
+        '''
+        self.seconds.update( other["seconds"] )
+        self.counts.update( other["counts"] )
+
+    def asDict(self):
+        return { "seconds": dict(self.seconds), "counts": dict(self.counts) }
+
+def swapStats(newStats):
+    '''
+    Make newStats the global RunStats and return the previous one. Workers
+    record into their own RunStats this way.
+    '''
+    global stats
+    oldStats = stats
+    stats = newStats
+    return oldStats
+
+def peakRssBytes(who=None):
+    '''
+    Peak resident set size of this process, or of its largest finished child
+    process if who is resource.RUSAGE_CHILDREN. None where it is not available.
+    '''
+    if ( resource is None ): return None
+    maxRss = resource.getrusage( resource.RUSAGE_SELF if who is None else who ).ru_maxrss
+    return maxRss if sys.platform == "darwin" else 1024 * maxRss    # Bytes on macOS, KiB elsewhere
+
+def writeStats(statsFileName):
+    '''
+    Write the global RunStats as JSON to the file statsFileName, or to stderr
+    if it is "-"
+    '''
+    report = stats.asDict()
+    report["wallSeconds"] = time.perf_counter() - stats.startTime
+    report["peakRssBytes"] = peakRssBytes()
+    report["peakChildRssBytes"] = peakRssBytes( resource.RUSAGE_CHILDREN ) if resource is not None else None
+    if ( statsFileName == "-" ):
+        json.dump( report, sys.stderr, indent=2 )
+        sys.stderr.write( "\n" )
+    else:
+        with open(statsFileName, "w") as f:
+            json.dump( report, f, indent=2 )
+
+################################
+# End run statistics functions
+################################
+
+
+diffAlgorithms = {
+    "myers":     myers_slices,
+    "patience":  patience_slices,
+    "hunt":      hunt_slices,
+    "reference": matching_slices,
+}
+
+Hunk = collections.namedtuple( "Hunk", ["oldStart", "oldStop", "newStart", "newStop"] )
+
+def get_hunks(a, b, algorithm="myers", matchTolerances=None):
+    '''
+    a and b are lists of the two files to be diffed (with any newlines removed)
+    algorithm is one of the keys of diffAlgorithms
+    matchTolerances, (absTol, relTol, intTol) or None, makes lines equal within
+    them match in the diff (--quantize). Not used by the reference algorithm.
+
+    Yields a Hunk for each differing section, holding the 0-based ranges
+    a[oldStart:oldStop] and b[newStart:newStop] of the differing lines.
+    '''
+    ia = ib = 0
+    if ( algorithm == "reference" ):
+        if ( stats is not None ): stats.start( "diff" )
+        slices = matching_slices(a, 0, len(a), b, 0, len(b))
+    else:
+        # Only the differing core between the common prefix and suffix is diffed
+        if ( stats is not None ): stats.start( "intern" )
+        nPrefix = common_prefix_length( a, b )
+        nSuffix = common_suffix_length( a, b, nPrefix )
+        a1 = len(a) - nSuffix
+        b1 = len(b) - nSuffix
+        aIds, aPos, bIds, bPos = intern_lines( a, nPrefix, a1, b, nPrefix, b1 )
+        if ( stats is not None ):
+            stats.stop()
+            stats.start( "diff" )
+        slices = diffAlgorithms[algorithm](aIds, 0, len(aIds), bIds, 0, len(bIds))
+        slices = merge_slices( [ (0, 0, nPrefix), (a1, b1, nSuffix) ] + remap_slices( slices, aPos, bPos ) )
+        if ( matchTolerances is not None ): slices = quantized_slices( slices, a, b, algorithm, matchTolerances )
+    if ( stats is not None ): stats.stop()
+    # A zero length slice at the end flushes any trailing differences
+    for sa, sb, n in slices + [ (len(a), len(b), 0) ]:
+        if ( ia != sa or ib != sb ):    # Differences before this slice
+            if ( stats is not None ): stats.counts["hunks"] += 1
+            yield Hunk( ia, sa, ib, sb )
         ia = sa + n
         ib = sb + n
-    return diffList
+
+def get_diff(a, b, algorithm="myers"):
+    '''
+    Returns the diff of a and b as a list of lines in GNU diff normal format
+    '''
+    return [ line for hunk in get_hunks(a, b, algorithm) for line in formatHunk(hunk, a, b) ]
+
 
 ################################
-# End Hunt–McIlroy diff algorithm functions
+# Begin ignored line functions
 ################################
+'''
+Volatile lines, such as timestamps, host names and timings, can be removed from
+both files before they are interned and diffed, so that they neither make hunks
+of their own nor break up long runs of matching lines. All the ignore rules are
+compiled into one regular expression, so each line is searched once. The line
+numbers of the lines kept are recorded so that the output still refers to the
+lines of the files. A lineNumbers array holds the 0-based line number in the
+file of each line kept, followed by the line number just after the last one.
+
+Each rule is compiled on its own first, so an invalid rule is reported by
+itself. Flags such as (?i) at the start of a rule are turned into a group
+with those flags around the rule. Rules with groups of their own are searched
+separately, since their group numbers and names would change or clash in the
+combined expression.
+'''
+
+globalFlagsPattern = re.compile( r"\(\?([aiLmsux]+)\)" )
+
+class IgnoreRules(object):
+    '''
+    Searches for any of several compiled patterns, like one combined pattern
+    '''
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.pattern = b" | ".join( pattern.pattern for pattern in patterns )
 
+    def search(self, line):
+        for pattern in self.patterns:
+            match = pattern.search( line )
+            if ( match ): return match
+        return None
 
-def processSectionHeader(tempList):
-    '''
-    Extract start, stop, and number of lines from diff section header
-    '''
-    if ( debug ): print( "\nprocessSectionHeader::tempList: ",tempList )
-    iStartOld = 0
-    iStopOld = 0
-    iStartNew = 0
-    iStopNew = 0
-    numLines = 0
-    if ( len(tempList) == 4 ):
-       iStartOld = int( tempList[0] )
-       iStopOld =  int( tempList[1] )
-       numLinesOld = iStopOld - iStartOld + 1
-       iStartNew = int( tempList[2] )
-       iStopNew = int( tempList[3] )
-       numLinesNew = iStopNew - iStartNew + 1
-       if ( debug ):
-           print( "       processSectionHeader::tempList:iStartOld = {:d}".format( iStartOld ) )
-           print( "        processSectionHeader::tempList:iStopOld = {:d}".format( iStopOld ) )
-           print( "     processSectionHeader::tempList:numLinesOld = {:d}".format( numLinesOld ) )
-           print( "      processSectionHeader::tempList: iStartNew = {:d}".format( iStartNew ) )
-           print( "        processSectionHeader::tempList:iStopNew = {:d}".format( iStopNew ) )
-           print( "     processSectionHeader::tempList:numLinesNew = {:d}".format( numLinesNew ) )
+def scopedRule(rule):
+    '''
+    rule, a regular expression, with the flags at its start, such as (?i),
+    applied to a group around it instead
+    '''
+    flags = ""
+    match = globalFlagsPattern.match( rule )
+    while ( match ):
+        flags += match.group(1)
+        rule = rule[match.end():]
+        match = globalFlagsPattern.match( rule )
+    if ( not flags ): return rule
+    return "(?{:s}:{:s}{:s})".format( flags, rule, "\n" if "x" in flags else "" )    # A verbose comment ends at the newline
+
+def compileIgnoreRules(patterns=(), ruleFiles=()):
+    '''
+    One regular expression searching for any of the patterns and of the rules
+    in ruleFiles, one per line. Blank lines and lines starting with # are
+    skipped. The expression searches lines as bytes. It is an IgnoreRules if
+    some rules have groups. Returns None if there are no rules. Raises
+    re.error naming the rule if a rule is invalid.
+    '''
+    rules = list( patterns )
+    for ruleFile in ruleFiles:
+        with open(ruleFile) as f:
+            rules.extend( rule.rstrip('\n') for rule in f if rule.strip() and not rule.startswith('#') )
+    if ( not rules ): return None
+    combinedRules = []
+    separatePatterns = []
+    for rule in rules:
+        try:
+            compiled = re.compile( rule.encode( textEncoding, "surrogateescape" ) )
+        except re.error as error:
+            raise re.error( "invalid rule {!r}: {:s}".format( rule, str(error) ) )
+        if ( compiled.groups > 0 ):
+            separatePatterns.append( compiled )
+        else:
+            combinedRules.append( scopedRule( rule ) )
+    if ( combinedRules ):
+        combined = "|".join( "(?:{:s})".format( rule ) for rule in combinedRules )
+        separatePatterns.insert( 0, re.compile( combined.encode( textEncoding, "surrogateescape" ) ) )
+    if ( len(separatePatterns) == 1 ): return separatePatterns[0]
+    return IgnoreRules( separatePatterns )
+
+def filterLines(lines, ignorePattern):
+    '''
+    The lines not searched by ignorePattern and their lineNumbers. The lines
+    kept from a LineBuffer share its buffer.
+    '''
+    search = ignorePattern.search
+    lineNumbers = array.array( 'l' )
+    for iLine in range(len(lines)):
+        if ( not search(lines[iLine]) ): lineNumbers.append( iLine )
+    if ( isinstance(lines, LineBuffer) ):
+        ends = lines.ends
+        if ( ends is None ): ends = [ start - 1 for start in itertools.islice( lines.starts, 1, None ) ]
+        keptLines = LineBuffer( lines.data, array.array( 'q', ( lines.starts[iLine] for iLine in lineNumbers ) ),
+                                array.array( 'q', ( ends[iLine] for iLine in lineNumbers ) ) )
     else:
-       iStartOld = int( tempList[0] )
-       iStartNew = int( tempList[1] )
-       numLinesOld = 1
-       numLinesNew = 1
-       if ( debug ):
-           print( "       processSectionHeader::tempList:iStartOld = {:d}".format( iStartOld ) )
-           print( "       processSectionHeader::tempList:iStartNew = {:d}".format( iStartNew ) )
-           print( "     processSectionHeader::tempList:numLinesOld = {:d}".format( numLinesOld ) )
-    return iStartOld, iStopOld, numLinesOld, iStartNew, iStopNew, numLinesNew
-
-def processDiffSectionRemovals(diffSection,removeString):
-    processedDiffSection = []
-    for line in diffSection:
-        if ( line[0:10] == removeString ): continue # Remove this
-        processedDiffSection.append( line )
-    return processedDiffSection
+        keptLines = [ lines[iLine] for iLine in lineNumbers ]
+    lineNumbers.append( len(lines) )
+    return keptLines, lineNumbers
+
+def originalHunk(hunk, lineNumbers):
+    '''
+    hunk with its ranges mapped to the line numbers of the files. lineNumbers
+    is (oldLineNumbers, newLineNumbers), or None if no lines were ignored.
+    An empty range is placed just before the next line kept.
+    '''
+    if ( lineNumbers is None ): return hunk
+    oldLineNumbers, newLineNumbers = lineNumbers
+    def originalRange(start, stop, numbers):
+        if ( stop == start ): return numbers[start], numbers[start]
+        return numbers[start], numbers[stop-1] + 1
+    oldStart, oldStop = originalRange( hunk.oldStart, hunk.oldStop, oldLineNumbers )
+    newStart, newStop = originalRange( hunk.newStart, hunk.newStop, newLineNumbers )
+    return Hunk( oldStart, oldStop, newStart, newStop )
+
+################################
+# End ignored line functions
+################################
+
+
+################################
+# Begin streaming diff functions
+################################
+'''
+Bounded-memory diff of files too large to read at once. Both files are read
+into windows of at most about maxBytes between them. Each pair of windows is
+cut just after a synchronization anchor, a line unique to and shared by both
+windows, and the part before the cut is diffed on its own. The rest is kept
+for the next window. The output is the same as the in-memory diff as long as
+the anchors are real synchronization points of the two files and no hunk is
+longer than a window. Longer hunks are split at the window ends.
+'''
+
+streamMaxBytes = 256 * 1024 * 1024
+streamLineOverhead = 80    # Approximate bytes per line on top of its characters
+
+def read_lines(f, lines, maxBytes, lineNumbers=None, ignorePattern=None):
+    '''
+    Append lines from the file f, open in binary mode, to lines, removing their
+    line ends, until lines holds about maxBytes, appending at least one line so
+    that the windows always move on. Returns True if the end of f was reached.
+    Lines searched by ignorePattern, if given, are skipped and the lineNumbers
+    of lines are kept up to date.
+    '''
+    nBytes = sum( len(line) for line in lines ) + streamLineOverhead * len(lines)
+    nAppended = 0
+    while ( nBytes < maxBytes or nAppended == 0 ):
+        line = f.readline()
+        if ( not line ): return True
+        line = stripLineEnd( line )
+        if ( ignorePattern is not None ):
+            iLine = lineNumbers.pop()    # The line number just after the last one is this one
+            ignored = ignorePattern.search( line )
+            if ( not ignored ): lineNumbers.append( iLine )
+            lineNumbers.append( iLine + 1 )
+            if ( ignored ): continue
+        lines.append( line )
+        nAppended += 1
+        nBytes += len(line) + streamLineOverhead
+    return False
+
+def stream_sync_point(a, b, algorithm="myers", matchTolerances=None):
+    '''
+    Numbers of lines (ia, ib) at which the windows a and b are cut: just after
+    the last anchor of the patience chain of lines unique to both windows.
+    Without anchors, the cut is at the start of a last hunk reaching the end of
+    both windows, otherwise after the whole windows.
+    '''
+    anchors = longest_increasing_pairs( unique_common_lines( a, 0, len(a), b, 0, len(b) ) )
+    if ( anchors ):
+        ia, ib = anchors[-1]
+        return ia + 1, ib + 1
+    hunks = list( get_hunks( a, b, algorithm, matchTolerances ) )
+    if ( hunks and hunks[-1].oldStop == len(a) and hunks[-1].newStop == len(b) and
+         (hunks[-1].oldStart > 0 or hunks[-1].newStart > 0) ):
+        return hunks[-1].oldStart, hunks[-1].newStart
+    return len(a), len(b)
+
+def get_stream_hunks(oldf, newf, algorithm="myers", maxBytes=streamMaxBytes, matchTolerances=None, ignorePattern=None):
+    '''
+    oldf and newf are the open files to be diffed
+
+    Yields (a, b, aOffset, bOffset, lineNumbers, hunks) for consecutive windows
+    of the files. a and b are the lines of the windows, aOffset and bOffset the
+    number of lines before them in the files and hunks the Hunks of a and b.
+    If lines searched by ignorePattern are skipped, lineNumbers is the pair of
+    lineNumbers of a and b and the offsets are 0, otherwise it is None.
+    '''
+    a = []
+    b = []
+    aOffset = bOffset = 0
+    aNumbers = [ 0 ]
+    bNumbers = [ 0 ]
+    while True:
+        if ( stats is not None ): stats.start( "read" )
+        aEof = read_lines( oldf, a, maxBytes // 2, aNumbers, ignorePattern )
+        bEof = read_lines( newf, b, maxBytes // 2, bNumbers, ignorePattern )
+        if ( stats is not None ): stats.stop()
+        if ( aEof and bEof ):
+            lineNumbers = None if ignorePattern is None else ( aNumbers, bNumbers )
+            yield a, b, aOffset, bOffset, lineNumbers, get_hunks( a, b, algorithm, matchTolerances )
+            return
+        if ( stats is not None ): stats.start( "diff" )
+        ia, ib = stream_sync_point( a, b, algorithm, matchTolerances )
+        if ( stats is not None ): stats.stop()
+        aWindow = a[:ia]
+        bWindow = b[:ib]
+        lineNumbers = None if ignorePattern is None else ( aNumbers[:ia+1], bNumbers[:ib+1] )
+        yield aWindow, bWindow, aOffset, bOffset, lineNumbers, get_hunks( aWindow, bWindow, algorithm, matchTolerances )
+        del a[:ia]
+        del b[:ib]
+        if ( ignorePattern is None ):
+            aOffset += ia
+            bOffset += ib
+        else:
+            del aNumbers[:ia]
+            del bNumbers[:ib]
+
+################################
+# End streaming diff functions
+################################
+
+
+################################
+# Begin field classification and line parsing functions
+################################
+'''
+Each field is classified once by a regular expression instead of calling
+int() and float() and catching the exceptions. Group 1 matches the strings
+int() accepts and group 2 the other strings float() accepts.
+'''
+
+FIELD_TEXT = 0
+FIELD_INTEGER = 1
+FIELD_FLOAT = 2
+
+numberPattern = re.compile( r"[+-]?(?:(\d+)|(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|inf(?:inity)?|nan))\Z", re.IGNORECASE )
+numberBytesPattern = re.compile( numberPattern.pattern.encode(), re.IGNORECASE )    # For fields of lines kept as bytes
+
+ParsedLine = collections.namedtuple( "ParsedLine", ["nFields", "fields", "kinds", "values"] )
+
+def classifyField(n):
+    '''
+    Returns FIELD_INTEGER, FIELD_FLOAT or FIELD_TEXT for a string or bytes
+    '''
+    match = ( numberBytesPattern if isinstance(n, bytes) else numberPattern ).match( n )
+    if ( match is None ): return FIELD_TEXT
+    if ( match.group(1) is not None ): return FIELD_INTEGER
+    return FIELD_FLOAT
 
 def isFloat(n):
     '''
     Checks to see if string is a floating point number
     '''
-    if ( isInteger(n) ): return False
-    try:
-        float(n)
-    except ValueError:
-        return False
-    else:
-        return True
+    return ( classifyField(n) == FIELD_FLOAT )
 
 def isInteger(n):
     '''
     Checks to see if string is an integer
     '''
+    return ( classifyField(n) == FIELD_INTEGER )
+
+def isNumber(n):
+    return ( classifyField(n) != FIELD_TEXT )
+
+def parseLine(line):
+    '''
+    Split a line into a ParsedLine holding the field count, the fields, their
+    kinds and their float values (None for text fields)
+    '''
+    fields = line.split()
+    kinds = [ classifyField(field) for field in fields ]
+    values = [ float(field) if kind else None for field, kind in zip(fields, kinds) ]
+    return ParsedLine( len(fields), fields, kinds, values )
+
+def getParsedLine(line, parsedLines):
+    '''
+    Parse a line, reusing the result for lines already in parsedLines
+    '''
+    parsed = parsedLines.get( line )
+    if ( parsed is None ):
+        parsed = parsedLines[line] = parseLine( line )
+    return parsed
+
+def countedIsClose(a, b, abs_tol, rel_tol):
+    '''
+    math.isclose() counting its evaluations in the global RunStats
+    '''
+    stats.counts["iscloseEvaluations"] += 1
+    return math.isclose( a, b, abs_tol=abs_tol, rel_tol=rel_tol )
+
+def linesWithinTolerance(oldParsed, newParsed, absTol, relTol, intTol, isclose=math.isclose):
+    '''
+    True if two parsed lines have the same number of fields and every pair of
+    differing fields are numbers equal within the tolerances. Integers are
+    only compared with tolerances if intTol is True. isclose is countedIsClose
+    when the comparisons are counted.
+    '''
+    if ( oldParsed.nFields != newParsed.nFields ): return False
+    numericKinds = ( FIELD_INTEGER, FIELD_FLOAT ) if intTol else ( FIELD_FLOAT, )
+    for oldField, newField, oldKind, newKind, oldValue, newValue in zip( oldParsed.fields, newParsed.fields,
+                                                                        oldParsed.kinds, newParsed.kinds,
+                                                                        oldParsed.values, newParsed.values ):
+        if ( oldField == newField ): continue
+        if ( oldKind not in numericKinds or newKind not in numericKinds ): return False
+        if ( not isclose( oldValue, newValue, abs_tol=absTol, rel_tol=relTol ) ): return False
+    return True
+
+def shapeKey(parsed, numericKinds):
+    '''
+    The fields of a parsed line with its numeric fields replaced by None. Two
+    lines can only be equal within tolerances if their shape keys are equal.
+    '''
+    if ( FIELD_TEXT not in parsed.kinds and (FIELD_INTEGER in numericKinds or FIELD_INTEGER not in parsed.kinds) ):
+        return ( None, ) * parsed.nFields    # All numeric, as in most lines of program output
+    return tuple( None if kind in numericKinds else field for field, kind in zip(parsed.fields, parsed.kinds) )
+
+def bucketByShape(parsedSection, numericKinds):
+    '''
+    Positions of the lines of a diff section grouped by shape key, in order
+    '''
+    buckets = {}
+    for iLine, parsed in enumerate(parsedSection):
+        buckets.setdefault( shapeKey(parsed, numericKinds), [] ).append( iLine )
+    return buckets
+
+pairReachLines = 32    # How far from its expected position a line's partner is searched for
+pairRunLines = 64      # Lines first compared at once when pairing a run of lines, doubled while they all pair
+
+class PartnerIndex(object):
+    '''
+    The new lines of a shape bucket sorted by the value of one of their numeric
+    fields, the one with the most distinct values, so that the partner of an
+    old line can be found anywhere in the bucket by comparing it only with the
+    new lines whose value is within the tolerances of its own. newColumns are
+    the values of the numeric fields of the new lines, one list per field.
+    Paired lines are skipped by links to the next line that may be unpaired,
+    so each is passed over about once.
+    '''
+    def __init__(self, nNew, newColumns, absTol, relTol):
+        distinct = [ len(set(values)) for values in newColumns ]
+        self.column = distinct.index( max(distinct) ) if newColumns else None
+        values = newColumns[self.column] if newColumns else [ 0.0 ] * nNew
+        finite = sorted( ( iNew for iNew in range(nNew) if math.isfinite(values[iNew]) ), key=values.__getitem__ )
+        self.values = [ values[iNew] for iNew in finite ]
+        self.lines = finite + [ iNew for iNew in range(nNew) if not math.isfinite(values[iNew]) ]    # Infinities and NaN last
+        self.links = list( range( 1, len(self.lines) + 1 ) )
+        self.absReach = absTol * (1.0 + 1.E-9)    # Rounding margin, the matches are compared exactly
+        self.relReach = relTol / (1.0 - relTol) * (1.0 + 1.E-9) if relTol < 1.0 else None
+
+    def nextUnpaired(self, k, paired):
+        '''
+        First position from k in lines of a line that is not paired
+        '''
+        skipped = []
+        while ( k < len(self.lines) and paired[self.lines[k]] ):
+            skipped.append( k )
+            k = self.links[k]
+        for iSkipped in skipped:
+            self.links[iSkipped] = k
+        return k
+
+    def find(self, oldValues, isMatch, paired):
+        '''
+        The first unpaired new line iNew for which isMatch(iNew), among those
+        that may be within the tolerances of the old line with numeric values
+        oldValues, None if there is none
+        '''
+        value = 0.0 if self.column is None else oldValues[self.column]
+        if ( not math.isfinite(value) ):
+            start, stop = len(self.values), len(self.lines)    # Only equal to the same infinity or NaN text
+        elif ( self.relReach is None ):
+            start, stop = 0, len(self.values)
+        else:
+            reach = max( self.absReach, self.relReach * abs(value) )
+            start = bisect.bisect_left( self.values, value - reach )
+            stop = bisect.bisect_right( self.values, value + reach )
+        k = self.nextUnpaired( start, paired )
+        while ( k < stop ):
+            if ( isMatch( self.lines[k] ) ): return self.lines[k]
+            k = self.nextUnpaired( k + 1, paired )
+        return None
+
+def pairBucketLines(nOld, nNew, matchRun, matches, matchAnywhere):
+    '''
+    Pair the old lines 0..nOld-1 of a shape bucket with its new lines
+    0..nNew-1. matchRun(iOld, iNew, n) is the number of leading line pairs
+    (iOld+k, iNew+k), k < n, that are equal within the tolerances,
+    matches(iOld, start, stop) iterates in order over the new lines in
+    start..stop-1 equal to old line iOld and matchAnywhere(iOld, paired) is an
+    unpaired new line equal to iOld anywhere in the bucket, None if there is
+    none, found with a PartnerIndex. Returns the paired new line of each old
+    line, None if there is none.
+
+    The partner of an old line is expected just after the partner of the
+    previous paired line, the cursor, and runs of lines that pair there are
+    taken at once, twice as many each time a whole run pairs. Otherwise the unpaired new lines at most pairReachLines
+    from the cursor are searched, first those after it in order, then those
+    before it, nearest first. Only if there is none there, as for lines moved
+    or shifted by inserted lines, is the partner looked up with
+    matchAnywhere(), and the cursor moves after it.
+    '''
+    pairedLines = [ None ] * nOld
+    paired = bytearray( nNew )
+    cursor = 0
+    iOld = 0
+    runLines = pairRunLines
+    while ( iOld < nOld ):
+        # Take the run of lines whose partners are where they are expected
+        nRunMax = min( runLines, nOld - iOld, nNew - cursor )
+        nRun = matchRun( iOld, cursor, nRunMax ) if cursor < nNew else 0
+        runLines = 2 * runLines if nRun == nRunMax else pairRunLines
+        if ( nRun > 0 ):
+            iPaired = paired.find( 1, cursor, cursor + nRun )
+            if ( iPaired >= 0 ): nRun = iPaired - cursor
+        if ( nRun > 0 ):
+            for iRun in range(nRun):
+                pairedLines[iOld+iRun] = cursor + iRun
+            paired[cursor:cursor+nRun] = b"\x01" * nRun
+            iOld += nRun
+            cursor += nRun
+            continue
+
+        # Otherwise the nearest partner within reach of the cursor, or any
+        nearby = [ iNew for iNew in matches( iOld, max( cursor - pairReachLines, 0 ), min( cursor + pairReachLines + 1, nNew ) )
+                   if not paired[iNew] ]
+        iAfter = bisect.bisect_left( nearby, cursor )
+        iNew = nearby[iAfter] if iAfter < len(nearby) else nearby[-1] if nearby else None
+        if ( iNew is None ): iNew = matchAnywhere( iOld, paired )
+        if ( iNew is not None ):
+            pairedLines[iOld] = iNew
+            paired[iNew] = 1
+            cursor = iNew + 1
+        iOld += 1
+    return pairedLines
+
+def pythonPairSectionLines(oldParsedSection, newParsedSection, absTol, relTol, intTol):
+    '''
+    Pair each old line with an unpaired new line of the same shape that is
+    equal to it within the tolerances, as pairBucketLines() does. Returns the
+    position of the paired new line for each old line, None if there is none.
+    '''
+    numericKinds = ( FIELD_INTEGER, FIELD_FLOAT ) if intTol else ( FIELD_FLOAT, )
+    oldBuckets = bucketByShape( oldParsedSection, numericKinds )
+    newBuckets = bucketByShape( newParsedSection, numericKinds )
+    isclose = math.isclose if stats is None else countedIsClose
+    pairedLines = [ None ] * len(oldParsedSection)
+    nCompared = [ 0 ]
+    for key, oldPositions in oldBuckets.items():
+        newPositions = newBuckets.get( key )
+        if ( not newPositions ): continue
+        oldParsed = [ oldParsedSection[iLine] for iLine in oldPositions ]
+        newParsed = [ newParsedSection[iLine] for iLine in newPositions ]
+
+        def matchRun(iOld, iNew, n):
+            nRun = 0
+            while ( nRun < n and linesWithinTolerance( oldParsed[iOld+nRun], newParsed[iNew+nRun], absTol, relTol, intTol, isclose ) ):
+                nRun += 1
+            nCompared[0] += min( nRun + 1, n )
+            return nRun
+
+        def matches(iOld, start, stop):
+            for iNew in range(start, stop):
+                nCompared[0] += 1
+                if ( linesWithinTolerance( oldParsed[iOld], newParsed[iNew], absTol, relTol, intTol, isclose ) ): yield iNew
+
+        columns = [ iField for iField, field in enumerate(key) if field is None ]
+        partnerIndex = []    # Built on the first lookup
+
+        def matchAnywhere(iOld, paired):
+            if ( not partnerIndex ):
+                newColumns = [ [ parsed.values[iField] for parsed in newParsed ] for iField in columns ]
+                partnerIndex.append( PartnerIndex( len(newParsed), newColumns, absTol, relTol ) )
+
+            def isMatch(iNew):
+                nCompared[0] += 1
+                return linesWithinTolerance( oldParsed[iOld], newParsed[iNew], absTol, relTol, intTol, isclose )
+            return partnerIndex[0].find( [ oldParsed[iOld].values[iField] for iField in columns ], isMatch, paired )
+
+        for iOld, iNew in enumerate( pairBucketLines( len(oldPositions), len(newPositions), matchRun, matches, matchAnywhere ) ):
+            if ( iNew is not None ): pairedLines[oldPositions[iOld]] = newPositions[iNew]
+    if ( stats is not None ): stats.counts["linesCompared"] += nCompared[0]
+    return pairedLines
+
+################################
+# End field classification and line parsing functions
+################################
+
+
+################################
+# Begin tolerance-aware matching functions
+################################
+'''
+With --quantize the diff engine itself matches lines that are equal within the
+tolerances, so numbers drifting on every line no longer turn the whole file
+into one changed block. Each line is interned by a key in which every numeric
+field is replaced by the bucket of its value on a grid as wide as the
+tolerance: values in the same bucket are always within the tolerance. On the
+absolute grid the bucket width is absTol, on the relative grid the buckets are
+a factor 1+relTol wide, and each value uses the grid giving it the wider bucket.
+
+Close values on either side of a bucket boundary get different keys. An old
+line whose key is not found in the new file is therefore also looked up with
+one of its numeric fields moved to the neighbouring bucket nearest its value,
+and takes the ID of that key if a new line with it is equal within the
+tolerances. Matched pairs of lines that are not identical are verified
+again after the diff, so a match is never looser than the tolerances. Lines
+missed by the keys end up in hunks and are filtered as usual.
+
+The files are diffed by their text first. Only the differing sections that
+the tolerance filter would pair poorly, with different numbers of old and new
+lines that are both longer than its search reach, are diffed again by their
+quantized keys. Quantizing every line costs more than filtering a section whose
+lines pair one to one.
+'''
+
+def quantizeValue(value, absTol, relTol):
+    '''
+    Bucket of a float value and the neighbouring bucket nearest to it, None if
+    the value only matches itself
+    '''
+    if ( value != value ): return None, None    # NaN is never close, keyed by its field instead
+    if ( relTol > 0.0 and value != 0.0 and not math.isinf(value) and relTol * abs(value) >= absTol ):
+        position = math.log( abs(value) ) / math.log1p( relTol )
+        bucket = math.floor( position )
+        neighbour = bucket - 1 if position - bucket < 0.5 else bucket + 1
+        return ( "r", value > 0.0, bucket ), ( "r", value > 0.0, neighbour )
+    if ( absTol > 0.0 and not math.isinf(value) ):
+        position = value / absTol
+        bucket = math.floor( position )
+        neighbour = bucket - 1 if position - bucket < 0.5 else bucket + 1
+        return ( "a", bucket ), ( "a", neighbour )
+    return ( "=", value ), None
+
+def quantizedKey(parsed, numericKinds, absTol, relTol):
+    '''
+    Quantized key of a parsed line, as a list, and the neighbouring buckets
+    (iField, bucket) of its numeric fields
+    '''
+    key = list( parsed.fields )
+    neighbours = []
+    for iField, kind in enumerate(parsed.kinds):
+        if ( kind not in numericKinds ): continue
+        bucket, neighbour = quantizeValue( parsed.values[iField], absTol, relTol )
+        if ( bucket is not None ): key[iField] = bucket
+        if ( neighbour is not None ): neighbours.append( (iField, neighbour) )
+    return key, neighbours
+
+def quantized_intern_lines(a, a0, a1, b, b0, b1, tolerances, parsedLines):
+    '''
+    intern_lines() with the lines found in only one of the files interned by
+    their quantized keys, so lines equal within tolerances (absTol, relTol,
+    intTol) usually get the same ID. Lines found in both are interned by their
+    text and are never parsed. Parsed lines are shared through parsedLines.
+    '''
+    absTol, relTol, intTol = tolerances
+    numericKinds = ( FIELD_INTEGER, FIELD_FLOAT ) if intTol else ( FIELD_FLOAT, )
+    aLines = set( a[a0:a1] )
+    keyIds = {}        # Line text or quantized key tuple -> ID
+    keyLines = []      # Parsed distinct lines of b with each quantized ID, None for text IDs
+    lineIds = {}       # New line text -> ID
+    bLineIds = array.array( 'l' )
+    for j in range(b0, b1):
+        lineId = lineIds.get( b[j] )
+        if ( lineId is None ):
+            if ( b[j] in aLines ):
+                key = b[j]
+                parsed = None
+            else:
+                parsed = getParsedLine( b[j], parsedLines )
+                key = tuple( quantizedKey( parsed, numericKinds, absTol, relTol )[0] )
+            lineId = keyIds.get( key )
+            if ( lineId is None ):
+                lineId = keyIds[key] = len(keyLines)
+                keyLines.append( None if parsed is None else [] )
+            if ( parsed is not None ): keyLines[lineId].append( parsed )
+            lineIds[b[j]] = lineId
+        bLineIds.append( lineId )
+    inA = bytearray( len(keyLines) )
+    aIds = array.array( 'l' )
+    aPos = array.array( 'l' )
+    for i in range(a0, a1):
+        lineId = lineIds.get( a[i] )    # Old line text -> ID, -1 if not in b
+        if ( lineId is None ):
+            parsed = getParsedLine( a[i], parsedLines )
+            key, neighbours = quantizedKey( parsed, numericKinds, absTol, relTol )
+            lineId = keyIds.get( tuple(key), -1 )
+            # Otherwise try the keys with one field moved to its neighbouring bucket
+            for iField, neighbour in neighbours:
+                if ( lineId >= 0 ): break
+                neighbourId = keyIds.get( tuple( key[:iField] + [ neighbour ] + key[iField+1:] ), -1 )
+                if ( neighbourId >= 0 and any( linesWithinTolerance( parsed, bParsed, absTol, relTol, intTol )
+                                               for bParsed in keyLines[neighbourId] ) ):
+                    lineId = neighbourId
+            lineIds[a[i]] = lineId
+        if ( lineId < 0 ): continue    # Not in b
+        inA[lineId] = 1
+        aIds.append( lineId )
+        aPos.append( i )
+    bIds = array.array( 'l' )
+    bPos = array.array( 'l' )
+    for j in range(b0, b1):
+        lineId = bLineIds[j-b0]
+        if ( not inA[lineId] ): continue    # Not in a
+        bIds.append( lineId )
+        bPos.append( j )
+    return aIds, aPos, bIds, bPos
+
+def quantized_slices(slices, a, b, algorithm, tolerances):
+    '''
+    The matching slices of a and b, with the lines equal within tolerances
+    (absTol, relTol, intTol) also matched in the differing sections between
+    them that toleranceFilter() would pair poorly: those with different numbers
+    of old and new lines, both more than pairReachLines. Elsewhere the filter
+    pairs the lines in linear time, cheaper than quantizing them.
+    '''
+    parsedLines = {}
+    matched = list( slices )
+    ia = ib = 0
+    for sa, sb, n in slices + [ (len(a), len(b), 0) ]:
+        if ( sa - ia != sb - ib and min( sa - ia, sb - ib ) > pairReachLines ):
+            if ( stats is not None ): stats.start( "intern" )
+            aIds, aPos, bIds, bPos = quantized_intern_lines( a, ia, sa, b, ib, sb, tolerances, parsedLines )
+            if ( stats is not None ): stats.stop()
+            sectionSlices = diffAlgorithms[algorithm](aIds, 0, len(aIds), bIds, 0, len(bIds))
+            matched.extend( verify_slices( remap_slices( sectionSlices, aPos, bPos ), a, b, tolerances, parsedLines ) )
+        ia = sa + n
+        ib = sb + n
+    return merge_slices( matched )
+
+def verify_slices(slices, a, b, tolerances, parsedLines):
+    '''
+    Split the matching slices at the pairs of lines that are neither identical
+    nor equal within tolerances (absTol, relTol, intTol)
+    '''
+    absTol, relTol, intTol = tolerances
+    verified = []
+    for sa, sb, n in slices:
+        start = 0
+        for t in range(n):
+            if ( a[sa+t] == b[sb+t] ): continue
+            if ( linesWithinTolerance( getParsedLine( a[sa+t], parsedLines ), getParsedLine( b[sb+t], parsedLines ),
+                                       absTol, relTol, intTol ) ): continue
+            verified.append( (sa+start, sb+start, t-start) )
+            start = t + 1
+        verified.append( (sa+start, sb+start, n-start) )
+    return merge_slices( verified )
+
+################################
+# End tolerance-aware matching functions
+################################
+
+
+################################
+# Begin NumPy tolerance functions
+################################
+'''
+Optional vectorized backend for the tolerance comparisons. The numeric fields
+of the lines in each shape bucket of a diff section are packed into 2-D arrays
+so that many line pairs are compared in one array operation. It gives the same
+results as the pure Python functions.
+'''
+
+numpyMinPairs = 256    # Smaller sections are faster in pure Python with the auto backend
+numpyDiagonalLines = 1024    # Line pairs of a diagonal compared at once when pairing runs
+numpyDiagonalChunks = 16     # Chunks of diagonals kept, for the cursor returning to a diagonal
+
+def numpyIsClose(a, b, absTol, relTol):
+    '''
+    Element-wise math.isclose(): |a-b| <= max(relTol*max(|a|,|b|), absTol),
+    so both tolerances must be exceeded for a difference. Infinities are only
+    close to themselves and NaN is never close.
+    '''
+    with numpy.errstate( invalid="ignore", over="ignore" ):
+        diff = numpy.abs( a - b )
+        tol = numpy.maximum( relTol * numpy.maximum( numpy.abs(a), numpy.abs(b) ), absTol )
+        return ( (a == b) | (numpy.isfinite(diff) & (diff <= tol)) )
+
+def numpyPackLines(parsedSection, positions, columns, fieldIds):
+    '''
+    Pack the numeric fields (columns) of the lines at positions into a 2-D
+    array of float values, converted in one call. NaN is only equal to the same
+    string, so if there is any NaN the IDs of the strings of the NaN fields are
+    packed too, -1 for the other fields, otherwise the IDs are None.
+    '''
+    shape = ( len(positions), len(columns) )
+    rows = ( parsedSection[iLine].values for iLine in positions )
+    if ( 0 < len(columns) < parsedSection[positions[0]].nFields ): rows = map( operator.itemgetter( *columns ), rows )
+    values = numpy.array( list(rows) if columns else [], dtype=numpy.float64 ).reshape( shape )
+    nan = numpy.isnan( values )
+    if ( not nan.any() ): return None, values
+    ids = numpy.full( shape, -1, dtype=numpy.int64 )
+    for iRow, iColumn in zip( *numpy.nonzero(nan) ):
+        ids[iRow, iColumn] = fieldIds.setdefault( parsedSection[positions[iRow]].fields[columns[iColumn]], len(fieldIds) )
+    return ids, values
+
+def numpyPairSectionLines(oldParsedSection, newParsedSection, absTol, relTol, intTol):
+    '''
+    Same pairing as pythonPairSectionLines(), with the lines of each shape
+    bucket compared a chunk of a diagonal or a range of new lines at a time
+    '''
+    numericKinds = ( FIELD_INTEGER, FIELD_FLOAT ) if intTol else ( FIELD_FLOAT, )
+    oldBuckets = bucketByShape( oldParsedSection, numericKinds )
+    newBuckets = bucketByShape( newParsedSection, numericKinds )
+    pairedLines = [ None ] * len(oldParsedSection)
+    fieldIds = {}
+    for key, oldPositions in oldBuckets.items():
+        newPositions = newBuckets.get( key )
+        if ( not newPositions ): continue
+        columns = [ iField for iField, field in enumerate(key) if field is None ]
+        oldIds, oldValues = numpyPackLines( oldParsedSection, oldPositions, columns, fieldIds )
+        newIds, newValues = numpyPackLines( newParsedSection, newPositions, columns, fieldIds )
+
+        def lineMatch(olds, news, nPairs):
+            # A field pair matches if the strings are equal or the numbers are within tolerance
+            if ( stats is not None ):
+                stats.counts["linesCompared"] += nPairs
+                stats.counts["iscloseEvaluations"] += nPairs * len(columns)
+            fieldMatch = numpyIsClose( oldValues[olds], newValues[news], absTol, relTol )
+            if ( oldIds is not None and newIds is not None ): fieldMatch |= (oldIds[olds] == newIds[news]) & (oldIds[olds] >= 0)
+            return numpy.all( fieldMatch, axis=1 )
+
+        def pairMatch(iOld, iNew):
+            # One pair is compared faster without arrays
+            if ( stats is not None ): stats.counts["linesCompared"] += 1
+            return linesWithinTolerance( oldParsedSection[oldPositions[iOld]], newParsedSection[newPositions[iNew]], absTol, relTol, intTol )
+
+        diagonals = {}    # (iNew - iOld, chunk of old lines) -> bytes, 1 where the old line matches its new line
+
+        def diagonalChunk(offset, iChunk):
+            chunk = diagonals.get( (offset, iChunk) )
+            if ( chunk is None ):
+                start = iChunk * numpyDiagonalLines
+                stop = min( start + numpyDiagonalLines, len(oldPositions) )
+                lo = max( start, -offset )
+                hi = max( min( stop, len(newPositions) - offset ), lo )
+                chunkMatch = numpy.zeros( stop - start, dtype=numpy.uint8 )
+                chunkMatch[lo-start:hi-start] = lineMatch( slice( lo, hi ), slice( lo + offset, hi + offset ), hi - lo )
+                if ( len(diagonals) >= numpyDiagonalChunks ): del diagonals[next( iter(diagonals) )]
+                chunk = diagonals[(offset, iChunk)] = chunkMatch.tobytes()
+            return chunk
+
+        def matchRun(iOld, iNew, n):
+            # Looked up in whole chunks of the diagonal, so long runs and returns to it cost one array operation.
+            # A diagonal not yet compared there is only compared if its first pair matches.
+            if ( (iNew - iOld, iOld // numpyDiagonalLines) not in diagonals and not pairMatch( iOld, iNew ) ): return 0
+            nRun = 0
+            while ( nRun < n ):
+                iChunk, k = divmod( iOld + nRun, numpyDiagonalLines )
+                chunk = diagonalChunk( iNew - iOld, iChunk )
+                stop = min( len(chunk), k + n - nRun )
+                iMismatch = chunk.find( 0, k, stop )
+                if ( iMismatch >= 0 ): return nRun + iMismatch - k
+                nRun += stop - k
+            return nRun
+
+        def matches(iOld, start, stop):
+            if ( start >= stop ): return []
+            return ( numpy.flatnonzero( lineMatch( iOld, slice( start, stop ), stop - start ) ) + start ).tolist()
+
+        partnerIndex = []    # Built on the first lookup
+
+        def matchAnywhere(iOld, paired):
+            if ( not partnerIndex ):
+                partnerIndex.append( PartnerIndex( len(newPositions), newValues.T.tolist(), absTol, relTol ) )
+            return partnerIndex[0].find( oldValues[iOld].tolist(), lambda iNew: pairMatch( iOld, iNew ), paired )
+
+        for iOld, iNew in enumerate( pairBucketLines( len(oldPositions), len(newPositions), matchRun, matches, matchAnywhere ) ):
+            if ( iNew is not None ): pairedLines[oldPositions[iOld]] = newPositions[iNew]
+    return pairedLines
+
+################################
+# End NumPy tolerance functions
+################################
+
+
+################################
+# Begin tolerance filtering and output functions
+################################
+'''
+Hunks from get_hunks() stream through toleranceFilter() into one of the write
+functions, so output starts as soon as the first hunk is processed.
+'''
+
+FilteredHunk = collections.namedtuple( "FilteredHunk", ["hunk", "oldLines", "newLines"] )
+toleranceBackends = ( "auto", "numpy", "python" )
+
+def toleranceFilter(hunks, oldTextLines, newTextLines, absTol, relTol, intTol, backend="auto"):
+    '''
+    Drop the lines of each hunk that pair with a line equal within tolerances.
+    Yields a FilteredHunk for each hunk, with the indices of the old and new
+    lines that are still different.
+    '''
+    for hunk in hunks:
+        if ( stats is not None ): stats.start( "toleranceFilter" )
+        parsedLines = {}
+        oldParsedSection = [ getParsedLine( oldTextLines[iLine], parsedLines ) for iLine in range(hunk.oldStart, hunk.oldStop) ]
+        newParsedSection = [ getParsedLine( newTextLines[iLine], parsedLines ) for iLine in range(hunk.newStart, hunk.newStop) ]
+
+        # Pair old and new lines of the same shape that are equal within tolerances
+        if ( backend == "numpy" or (backend == "auto" and numpy is not None and
+                                    len(oldParsedSection) * len(newParsedSection) >= numpyMinPairs) ):
+            pairedLines = numpyPairSectionLines( oldParsedSection, newParsedSection, absTol, relTol, intTol )
+        else:
+            pairedLines = pythonPairSectionLines( oldParsedSection, newParsedSection, absTol, relTol, intTol )
+
+        newPaired = set( pairedLines )
+        oldLines = [ hunk.oldStart + iOldLine for iOldLine, iNewLine in enumerate(pairedLines) if iNewLine is None ]
+        newLines = [ hunk.newStart + iNewLine for iNewLine in range(len(newParsedSection)) if iNewLine not in newPaired ]
+        if ( debug ):
+            print( "toleranceFilter::{:s}: {:d} of {:d} old and {:d} of {:d} new lines different".format(
+                   hunkHeader(hunk), len(oldLines), len(oldParsedSection), len(newLines), len(newParsedSection) ) )
+        if ( stats is not None ):
+            stats.counts["fieldsParsed"] += sum( parsed.nFields for parsed in parsedLines.values() )
+            if ( not oldLines and not newLines ): stats.counts["hunksSuppressed"] += 1
+            stats.stop()
+        yield FilteredHunk( hunk, oldLines, newLines )
+
+def hunkHeader(hunk, oldOffset=0, newOffset=0):
+    '''
+    GNU diff normal format header of a hunk, except that every hunk is
+    reported as a change "c". The offsets are added to the line numbers.
+    '''
+    if ( hunk.oldStop - hunk.oldStart == 1 and hunk.newStop - hunk.newStart == 1 ):
+        return "{:d}c{:d}".format( oldOffset+hunk.oldStart+1, newOffset+hunk.newStart+1 )
+    return "{:d},{:d}c{:d},{:d}".format( oldOffset+hunk.oldStart+1, oldOffset+hunk.oldStop,
+                                         newOffset+hunk.newStart+1, newOffset+hunk.newStop )
+
+def formatHunk(hunk, oldTextLines, newTextLines, oldOffset=0, newOffset=0, lineNumbers=None):
+    '''
+    Yields the lines of a hunk in GNU diff normal format. lineNumbers is
+    (oldLineNumbers, newLineNumbers) if lines were ignored.
+    '''
+    yield hunkHeader( originalHunk( hunk, lineNumbers ), oldOffset, newOffset )
+    for line in oldTextLines[hunk.oldStart:hunk.oldStop]:
+        yield "< " + lineText( line )
+    yield "---"
+    for line in newTextLines[hunk.newStart:hunk.newStop]:
+        yield "> " + lineText( line )
+
+def writeDiff(diffFile, hunks, oldTextLines, newTextLines, oldOffset=0, newOffset=0, maxHunks=None, lineNumbers=None):
+    '''
+    Write hunks in GNU diff normal format. Returns the number of hunks written.
+    The offsets are added to the line numbers written, after mapping them with
+    lineNumbers, (oldLineNumbers, newLineNumbers), if lines were ignored.
+    Stops after maxHunks hunks, if given, so the remaining hunks are never
+    computed.
+    '''
+    nHunks = 0
+    if ( maxHunks == 0 ): return nHunks
+    for hunk in hunks:
+        nHunks += 1
+        for line in formatHunk( hunk, oldTextLines, newTextLines, oldOffset, newOffset, lineNumbers ):
+            diffFile.write( line + "\n" )
+        if ( nHunks == maxHunks ): break
+    return nHunks
+
+def writeToleranceDiff(diffFile, filteredHunks, oldTextLines, newTextLines, oldOffset=0, newOffset=0, maxHunks=None,
+                       lineNumbers=None):
+    '''
+    Write the lines of each filtered hunk that are still different. Returns the
+    number of hunks with lines written. The offsets are added to the line
+    numbers written, after mapping them with lineNumbers, (oldLineNumbers,
+    newLineNumbers), if lines were ignored. Stops after maxHunks hunks with
+    lines written, if given, so the remaining hunks are never filtered.
+    '''
+    nHunks = 0
+    if ( maxHunks == 0 ): return nHunks
+    for hunk, oldLines, newLines in filteredHunks:
+        if ( len(oldLines) > 0 or len(newLines) > 0 ): nHunks += 1
+        hunk = originalHunk( hunk, lineNumbers )
+
+        # Write processed Old Diff Section
+        if ( len(oldLines) > 0 ):
+            diffFile.write( "********* Around line {:d}\n".format( oldOffset+hunk.oldStart+1 ) )
+            for iLine in oldLines: diffFile.write( "< " + lineText( oldTextLines[iLine] ) + "\n" )
+
+        # Write processed New Diff Section
+        if ( len(newLines) > 0 ):
+            diffFile.write( "--------- Around line {:d}\n".format( newOffset+hunk.newStart+1 ) )
+            for iLine in newLines: diffFile.write( "> " + lineText( newTextLines[iLine] ) + "\n" )
+        if ( nHunks == maxHunks ): break
+    return nHunks
+
+################################
+# End tolerance filtering and output functions
+################################
+
+
+################################
+# Begin parallel diff functions
+################################
+'''
+A single large pair of files is cut into independent pairs of segments just
+after anchors, lines unique to and shared by both files, which are diffed and
+tolerance filtered by a process pool. The results are written in order, with
+line numbers offset to the whole files.
+'''
+
+def partition_at_anchors(a, b, nSegments):
+    '''
+    Cut points [(0, 0), ..., (len(a), len(b))] splitting a and b into at most
+    nSegments pairs of segments of about equal length. Each cut is just after
+    an anchor on the patience chain of lines unique to both files.
+    '''
+    anchors = longest_increasing_pairs( unique_common_lines( a, 0, len(a), b, 0, len(b) ) )
+    anchorsA = [ ia for ia, ib in anchors ]
+    cuts = [ (0, 0) ]
+    for iSegment in range(1, nSegments):
+        iAnchor = bisect.bisect_left( anchorsA, iSegment * len(a) // nSegments )
+        if ( iAnchor == len(anchors) ): break
+        ia, ib = anchors[iAnchor]
+        if ( ia + 1 > cuts[-1][0] ): cuts.append( (ia + 1, ib + 1) )
+    if ( cuts[-1] != (len(a), len(b)) ): cuts.append( (len(a), len(b)) )
+    return cuts
+
+def diffSegment(task):
+    '''
+    Diff and tolerance filter one pair of segments, in a worker process.
+    tolerances is None or (absTol, relTol, intTol), with quantize also used
+    to match lines in the diff. lineNumbers, if lines were ignored, are those
+    of the segments. Returns the output text, the offset in it of the end of
+    each hunk written, at most maxHunks, and the RunStats.asDict() of the
+    segment if withStats is set.
+    '''
+    a, b, aOffset, bOffset, lineNumbers, algorithm, tolerances, quantize, backend, maxHunks, withStats = task
+    outerStats = swapStats( RunStats() if withStats else None )
+    segmentFile = io.StringIO()
+    hunks = get_hunks( a, b, algorithm, tolerances if quantize else None )
+    if ( tolerances is not None ):
+        absTol, relTol, intTol = tolerances
+        hunks = toleranceFilter( hunks, a, b, absTol, relTol, intTol, backend )
+    hunkEnds = []
+    for hunk in hunks:
+        if ( tolerances is None ):
+            nHunks = writeDiff( segmentFile, [ hunk ], a, b, aOffset, bOffset, lineNumbers=lineNumbers )
+        else:
+            nHunks = writeToleranceDiff( segmentFile, [ hunk ], a, b, aOffset, bOffset, lineNumbers=lineNumbers )
+        if ( nHunks > 0 ): hunkEnds.append( segmentFile.tell() )
+        if ( len(hunkEnds) == maxHunks ): break
+    segmentStats = swapStats( outerStats )
+    return segmentFile.getvalue(), hunkEnds, None if segmentStats is None else segmentStats.asDict()
+
+def writeParallelDiff(diffFile, a, b, algorithm, tolerances, backend, jobs, maxHunks=None, quantize=False, lineNumbers=None):
+    '''
+    Diff a and b with a pool of jobs worker processes and write the results in
+    order. Returns the number of hunks written. Stops after maxHunks hunks, if
+    given, and drops the segments still being diffed. lineNumbers is
+    (oldLineNumbers, newLineNumbers) if lines were ignored.
+    '''
+    if ( stats is not None ): stats.start( "diff" )
+    cuts = partition_at_anchors( a, b, 4 * jobs )    # More segments than jobs to balance the load
+    if ( stats is not None ): stats.stop()
+    if ( debug ): print( "writeParallelDiff::{:d} segments".format( len(cuts) - 1 ) )
+    if ( lineNumbers is None ):
+        tasks = ( (a[ia0:ia1], b[ib0:ib1], ia0, ib0, None, algorithm, tolerances, quantize, backend, maxHunks, stats is not None)
+                  for (ia0, ib0), (ia1, ib1) in zip(cuts, cuts[1:]) )
+    else:
+        oldLineNumbers, newLineNumbers = lineNumbers
+        tasks = ( (a[ia0:ia1], b[ib0:ib1], 0, 0, ( oldLineNumbers[ia0:ia1+1], newLineNumbers[ib0:ib1+1] ),
+                   algorithm, tolerances, quantize, backend, maxHunks, stats is not None)
+                  for (ia0, ib0), (ia1, ib1) in zip(cuts, cuts[1:]) )
+    nHunks = 0
+    pool = multiprocessing.Pool( jobs )
     try:
-        int(n)
-    except ValueError:
-        return False
+        for text, hunkEnds, segmentStats in pool.imap( diffSegment, tasks ):
+            if ( segmentStats is not None ): stats.merge( segmentStats )
+            if ( maxHunks is not None and nHunks + len(hunkEnds) >= maxHunks ):
+                if ( maxHunks > nHunks ): diffFile.write( text[:hunkEnds[maxHunks-nHunks-1]] )
+                nHunks = maxHunks
+                pool.terminate()
+                break
+            diffFile.write( text )
+            nHunks += len(hunkEnds)
+    finally:
+        pool.close()
+        pool.join()
+    return nHunks
+
+################################
+# End parallel diff functions
+################################
+
+
+################################
+# Begin file and batch diff functions
+################################
+
+def getTolerances(defaultTolerances=False, absolute=None, relative=None, integers=False):
+    '''
+    Tolerances (absTol, relTol, intTol) from the command line options, or None
+    if no tolerances are set. absolute and relative override the defaults.
+    '''
+    if ( not (defaultTolerances or absolute or relative) ): return None
+    absTol = 1.E-15 if defaultTolerances else 0.0
+    relTol = 1.E-8 if defaultTolerances else 0.0
+    if ( absolute ): absTol = float(absolute)
+    if ( relative ): relTol = float(relative)
+    return ( absTol, relTol, bool(integers) )
+
+def mergeTolerances(tolerances, defaultTolerances=False, absolute=None, relative=None, integers=False):
+    '''
+    The tolerances (absTol, relTol, intTol), or None, with the options of one
+    batch pair merged in: defaultTolerances resets both tolerances to the
+    defaults, absolute and relative override one and integers adds integers.
+    None if neither sets any tolerances.
+    '''
+    if ( tolerances is None or defaultTolerances ):
+        merged = getTolerances( defaultTolerances, absolute, relative, integers )
+        if ( merged is None or tolerances is None ): return merged
+        return ( merged[0], merged[1], merged[2] or tolerances[2] )
+    absTol, relTol, intTol = tolerances
+    if ( absolute ): absTol = float(absolute)
+    if ( relative ): relTol = float(relative)
+    return ( absTol, relTol, intTol or bool(integers) )
+
+def diffFiles(oldFile, newFile, diffFile, tolerances=None, algorithm="myers", backend="auto",
+              stream=False, maxBytes=streamMaxBytes, jobs=1, maxHunks=None, brief=False, quantize=False,
+              ignorePattern=None):
+    '''
+    Diff oldFile and newFile and write the diffs to the open diffFile, subject
+    to tolerances (absTol, relTol, intTol) unless it is None. With quantize
+    lines equal within the tolerances already match in the diff. Lines searched
+    by the compiled ignorePattern, if given, are removed before diffing.
+    Returns the number of diff sections written, at most maxHunks if given.
+
+    If brief is set only the verdict is wanted: nothing is written and 1 is
+    returned as soon as a diff section is found, 0 if there is none.
+    '''
+    # Byte-identical files have no diffs, skip reading and diffing them
+    if ( stats is not None ): stats.start( "read" )
+    identical = files_identical( oldFile, newFile )
+    if ( stats is not None ): stats.stop()
+    if ( identical ):
+        if ( debug ): print( "diffFiles::Files are identical" )
+        return 0
+
+    # Without tolerances any differing line is a diff section, no diff is needed
+    if ( brief and tolerances is None ):
+        if ( stats is not None ): stats.start( "read" )
+        differ = 0
+        with openInput(oldFile) as oldf, openInput(newFile) as newf:
+            oldLines = ( stripLineEnd( line ) for line in oldf )
+            newLines = ( stripLineEnd( line ) for line in newf )
+            if ( ignorePattern is not None ):
+                oldLines = ( line for line in oldLines if not ignorePattern.search(line) )
+                newLines = ( line for line in newLines if not ignorePattern.search(line) )
+            for oldLine, newLine in itertools.zip_longest( oldLines, newLines ):
+                if ( oldLine != newLine ):
+                    differ = 1
+                    break
+        if ( stats is not None ): stats.stop()
+        return differ
+    if ( brief ):
+        diffFile = io.StringIO()    # Holds at most the first diff section, discarded
+        maxHunks = 1
+
+    matchTolerances = tolerances if quantize else None
+
+    # In stream mode diff and write the files window by window
+    if ( stream ):
+        nDiffSections = 0
+        with openInput(oldFile) as oldf, openInput(newFile) as newf:
+            for oldTextLines, newTextLines, oldOffset, newOffset, lineNumbers, hunks in get_stream_hunks( oldf, newf, algorithm, maxBytes,
+                                                                                                         matchTolerances, ignorePattern ):
+                maxWindowHunks = None if maxHunks is None else maxHunks - nDiffSections
+                if ( stats is not None ):
+                    stats.counts["oldLines"] += len(oldTextLines)
+                    stats.counts["newLines"] += len(newTextLines)
+                    stats.start( "write" )
+                if ( tolerances is None ):
+                    nDiffSections += writeDiff( diffFile, hunks, oldTextLines, newTextLines, oldOffset, newOffset, maxWindowHunks,
+                                                lineNumbers )
+                else:
+                    absTol, relTol, intTol = tolerances
+                    filteredHunks = toleranceFilter( hunks, oldTextLines, newTextLines, absTol, relTol, intTol, backend )
+                    nDiffSections += writeToleranceDiff( diffFile, filteredHunks, oldTextLines, newTextLines, oldOffset, newOffset, maxWindowHunks,
+                                                         lineNumbers )
+                if ( stats is not None ): stats.stop()
+                if ( nDiffSections == maxHunks ): break
+        return nDiffSections
+
+    # Read input files once, as LineBuffers of their bytes
+    if ( stats is not None ): stats.start( "read" )
+    oldTextLines = readLineBuffer( oldFile )
+    newTextLines = readLineBuffer( newFile )
+    if ( stats is not None ):
+        stats.stop()
+        stats.counts["oldLines"] += len(oldTextLines)
+        stats.counts["newLines"] += len(newTextLines)
+
+    # Remove the ignored lines, keeping the line numbers of the others
+    lineNumbers = None
+    if ( ignorePattern is not None ):
+        if ( stats is not None ): stats.start( "read" )
+        nLines = len(oldTextLines) + len(newTextLines)
+        oldTextLines, oldLineNumbers = filterLines( oldTextLines, ignorePattern )
+        newTextLines, newLineNumbers = filterLines( newTextLines, ignorePattern )
+        lineNumbers = ( oldLineNumbers, newLineNumbers )
+        if ( stats is not None ):
+            stats.stop()
+            stats.counts["linesIgnored"] += nLines - len(oldTextLines) - len(newTextLines)
+    if ( stats is not None ): stats.start( "write" )
+
+    # The hunks are diffed and filtered lazily as they are written, each
+    # phase records its own time while the write phase is running
+    if ( jobs > 1 ):
+        nDiffSections = writeParallelDiff( diffFile, oldTextLines, newTextLines, algorithm, tolerances, backend, jobs, maxHunks, quantize,
+                                           lineNumbers )
+    elif ( tolerances is None ):
+        hunks = get_hunks( oldTextLines, newTextLines, algorithm )
+        nDiffSections = writeDiff( diffFile, hunks, oldTextLines, newTextLines, maxHunks=maxHunks, lineNumbers=lineNumbers )
     else:
-        return True
+        absTol, relTol, intTol = tolerances
+        hunks = get_hunks( oldTextLines, newTextLines, algorithm, matchTolerances )
+        filteredHunks = toleranceFilter( hunks, oldTextLines, newTextLines, absTol, relTol, intTol, backend )
+        nDiffSections = writeToleranceDiff( diffFile, filteredHunks, oldTextLines, newTextLines, maxHunks=maxHunks, lineNumbers=lineNumbers )
+    if ( stats is not None ): stats.stop()
+    return nDiffSections
 
-def isNumber(n):
-    return ( isFloat(n) or isInteger(n) )
+'''
+Batch mode compares many pairs of files in one process, or in a pool of worker
+processes, and writes one consolidated report. Pairs come from matching the
+relative paths of the files under two directory trees, or from a manifest file.
+The largest pairs are started first to keep the pool busy.
+'''
+
+def batchTreePairs(oldRoot, newRoot, tolerances):
+    '''
+    Pairs (label, oldFile, newFile, tolerances) of the files with the same path
+    relative to oldRoot and newRoot. Files found under only one of them get
+    None for the other file name.
+    '''
+    def relativePaths(root):
+        paths = set()
+        for dirPath, dirNames, fileNames in os.walk(root):
+            for fileName in fileNames:
+                paths.add( os.path.relpath( os.path.join(dirPath, fileName), root ) )
+        return paths
+    oldPaths = relativePaths( oldRoot )
+    newPaths = relativePaths( newRoot )
+    pairs = []
+    for path in sorted( oldPaths | newPaths ):
+        oldFile = os.path.join( oldRoot, path ) if path in oldPaths else None
+        newFile = os.path.join( newRoot, path ) if path in newPaths else None
+        pairs.append( (path, oldFile, newFile, tolerances) )
+    return pairs
+
+def readManifest(manifestFile, tolerances):
+    '''
+    Pairs (label, oldFile, newFile, tolerances) from a manifest file. Each line
+    holds an old and a new file name, relative to the manifest directory unless
+    absolute, optionally followed by -t, -a, -r and -i options that are merged
+    into the tolerances given on the command line for that pair. Blank lines
+    and lines starting with # are skipped.
+    '''
+    parser = argparse.ArgumentParser( prog=manifestFile, add_help=False )
+    parser.add_argument( "OldFile" )
+    parser.add_argument( "NewFile" )
+    parser.add_argument( "-t","--defaultTolerances", action="store_true" )
+    parser.add_argument( "-a","--absolute", action="store" )
+    parser.add_argument( "-r","--relative", action="store" )
+    parser.add_argument( "-i","--integers", action="store_true" )
+    manifestDir = os.path.dirname( os.path.abspath(manifestFile) )
+    pairs = []
+    with open(manifestFile) as manifest:
+        for line in manifest:
+            fields = shlex.split( line, comments=True )
+            if ( not fields ): continue
+            lineArgs = parser.parse_args( fields )
+            pairTolerances = mergeTolerances( tolerances, lineArgs.defaultTolerances, lineArgs.absolute, lineArgs.relative, lineArgs.integers )
+            oldFile = os.path.join( manifestDir, lineArgs.OldFile )
+            newFile = os.path.join( manifestDir, lineArgs.NewFile )
+            pairs.append( ("{:s} {:s}".format( lineArgs.OldFile, lineArgs.NewFile ), oldFile, newFile, pairTolerances) )
+    return pairs
+
+def batchCompare(task):
+    '''
+    Compare one pair of files, in a worker process. Returns the pair index,
+    the diff text, the number of diff sections, an error message or None and
+    the RunStats.asDict() of the pair if withStats is set.
+    '''
+    iPair, oldFile, newFile, tolerances, withStats, options = task
+    outerStats = swapStats( RunStats() if withStats else None )
+    pairFile = io.StringIO()
+    try:
+        nDiffSections = diffFiles( oldFile, newFile, pairFile, tolerances, **options )
+    except (IOError, OSError, UnicodeDecodeError, ValueError) + compressionErrors as error:
+        text, nDiffSections, message = "", 0, str(error)
+    else:
+        text, message = pairFile.getvalue(), None
+    pairStats = swapStats( outerStats )
+    return iPair, text, nDiffSections, message, None if pairStats is None else pairStats.asDict()
+
+def batchDiff(diffFile, pairs, jobs=1, **options):
+    '''
+    Compare pairs (label, oldFile, newFile, tolerances) with jobs worker
+    processes and write one report to diffFile. options are passed on to
+    diffFiles(), with brief set only the verdict of each pair is reported.
+    Returns the exit status: 0 if no pair has diffs, 1 if any pair has diffs or
+    a missing file and 2 if any pair could not be compared.
+    '''
+    results = [ None ] * len(pairs)
+    tasks = []
+    for iPair, (label, oldFile, newFile, tolerances) in enumerate(pairs):
+        if ( oldFile is None or newFile is None ):
+            results[iPair] = ( "", 0, None )
+            continue
+        tasks.append( (iPair, oldFile, newFile, tolerances, stats is not None, options) )
+
+    # Largest pairs first so the pool stays balanced
+    def pairSize(task):
+        try:
+            return os.path.getsize( task[1] ) + os.path.getsize( task[2] )
+        except OSError:
+            return 0
+    tasks.sort( key=pairSize, reverse=True )
+
+    if ( jobs > 1 ):
+        pool = multiprocessing.Pool( jobs )
+        try:
+            for iPair, text, nDiffSections, error, pairStats in pool.imap_unordered( batchCompare, tasks ):
+                results[iPair] = ( text, nDiffSections, error )
+                if ( pairStats is not None ): stats.merge( pairStats )
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            iPair, text, nDiffSections, error, pairStats = batchCompare( task )
+            results[iPair] = ( text, nDiffSections, error )
+            if ( pairStats is not None ): stats.merge( pairStats )
+
+    # Write the report in the order of the pairs
+    nSame = nDiff = nError = nMissing = 0
+    for (label, oldFile, newFile, tolerances), (text, nDiffSections, error) in zip( pairs, results ):
+        if ( oldFile is None or newFile is None ):
+            nMissing += 1
+            diffFile.write( "========= ONLY IN {:s}: {:s}\n".format( "OLD" if newFile is None else "NEW", label ) )
+        elif ( error is not None ):
+            nError += 1
+            diffFile.write( "========= ERROR: {:s}: {:s}\n".format( label, error ) )
+        elif ( nDiffSections > 0 and options.get("brief") ):
+            nDiff += 1
+            diffFile.write( "========= DIFF: {:s}\n".format( label ) )
+        elif ( nDiffSections > 0 ):
+            nDiff += 1
+            diffFile.write( "========= DIFF: {:s} ({:d} diff sections)\n".format( label, nDiffSections ) )
+            diffFile.write( text )
+        else:
+            nSame += 1
+            diffFile.write( "========= SAME: {:s}\n".format( label ) )
+    diffFile.write( "Compared {:d} pairs: {:d} same, {:d} different, {:d} errors, {:d} missing\n".format(
+                    len(pairs), nSame, nDiff, nError, nMissing ) )
+    if ( nError > 0 ): return 2
+    if ( nDiff > 0 or nMissing > 0 ): return 1
+    return 0
+
+################################
+# End file and batch diff functions
+################################
+
+
+################################
+# Begin library API and server functions
+################################
+'''
+tol_diff() is the entry point for use as a library: it neither writes to
+stdout nor exits. The server mode answers tol_diff() requests on a local Unix
+socket, so that many comparisons pay for process startup and imports once.
+
+Each request is one line of JSON holding the tol_diff() arguments, for example
+    {"old": "ref/out.txt", "new": "run/out.txt", "rel_tol": 1e-8}
+and is answered by one line of JSON, either {"hunks": [...]} with each hunk
+as a dictionary of the DiffHunk fields, or {"error": "message"}.
+'''
+
+DiffHunk = collections.namedtuple( "DiffHunk", ["oldStart", "oldStop", "newStart", "newStop", "oldLines", "newLines"] )
+
+def readSourceLines(source):
+    '''
+    Lines of source as bytes without their line ends. source is a file name, a
+    bytes buffer, an open file or any other iterable of lines.
+    '''
+    if ( isinstance(source, (str, os.PathLike)) ):
+        return readLineBuffer( source )
+    if ( isinstance(source, (bytes, bytearray, memoryview)) ):
+        return LineBuffer( bytes(source) )
+    return [ stripLineEnd( line if isinstance(line, bytes) else line.encode( textEncoding, "surrogateescape" ) ) for line in source ]
+
+def tol_diff(old, new, abs_tol=None, rel_tol=None, integers=False, algorithm="myers", backend="auto", quantize=False,
+             ignore=None):
+    '''
+    Diff old and new, each a file name, a bytes buffer or an iterable of lines.
+    If abs_tol or rel_tol is given, lines equal within the tolerances are not
+    reported, as with the -a and -r options. integers and quantize as the -i
+    and -Q options. ignore is a regular expression, or a list of them, of lines
+    to remove before diffing, as the -x option.
+
+    Yields a DiffHunk for each section still different. oldStart, oldStop,
+    newStart and newStop are its 0-based line ranges, oldLines and newLines
+    lists of (line index, text) of its lines still different. Raises
+    ValueError for an unknown algorithm or backend.
+    '''
+    if ( algorithm not in diffAlgorithms ):
+        raise ValueError( "unknown algorithm {!r}, not one of {:s}".format( algorithm, ", ".join( sorted(diffAlgorithms) ) ) )
+    if ( backend not in toleranceBackends ):
+        raise ValueError( "unknown backend {!r}, not one of {:s}".format( backend, ", ".join( toleranceBackends ) ) )
+    if ( backend == "numpy" and numpy is None ):
+        raise ValueError( "the numpy backend requires NumPy, which is not installed" )
+    if ( abs_tol is None and rel_tol is None ):
+        tolerances = None
+    else:
+        tolerances = ( float(abs_tol or 0.0), float(rel_tol or 0.0), bool(integers) )
+    if ( isinstance(old, (str, os.PathLike)) and isinstance(new, (str, os.PathLike)) and files_identical( old, new ) ):
+        return
+    oldTextLines = readSourceLines( old )
+    newTextLines = readSourceLines( new )
+    ignorePattern = compileIgnoreRules( [ ignore ] if isinstance(ignore, str) else ignore or () )
+    if ( ignorePattern is None ):
+        lineNumbers = None
+        oldLineNumbers = newLineNumbers = range( max( len(oldTextLines), len(newTextLines) ) + 1 )
+    else:
+        oldTextLines, oldLineNumbers = filterLines( oldTextLines, ignorePattern )
+        newTextLines, newLineNumbers = filterLines( newTextLines, ignorePattern )
+        lineNumbers = ( oldLineNumbers, newLineNumbers )
+    hunks = get_hunks( oldTextLines, newTextLines, algorithm, tolerances if quantize else None )
+    if ( tolerances is None ):
+        filteredHunks = ( FilteredHunk( hunk, range(hunk.oldStart, hunk.oldStop), range(hunk.newStart, hunk.newStop) ) for hunk in hunks )
+    else:
+        absTol, relTol, intTol = tolerances
+        filteredHunks = toleranceFilter( hunks, oldTextLines, newTextLines, absTol, relTol, intTol, backend )
+    for hunk, oldLines, newLines in filteredHunks:
+        if ( len(oldLines) == 0 and len(newLines) == 0 ): continue
+        yield DiffHunk( *originalHunk( hunk, lineNumbers ),
+                        oldLines=[ (oldLineNumbers[iLine], lineText( oldTextLines[iLine] )) for iLine in oldLines ],
+                        newLines=[ (newLineNumbers[iLine], lineText( newTextLines[iLine] )) for iLine in newLines ] )
+
+class ToleranceDiffHandler(socketserver.StreamRequestHandler):
+    '''
+    Answers each JSON request line on a server connection. Any error is
+    answered as {"error": message}, so a bad request never drops the
+    connection without a reply.
+    '''
+    def handle(self):
+        for line in self.rfile:
+            if ( not line.strip() ): continue
+            try:
+                request = json.loads( line )
+                if ( not isinstance(request, dict) ): raise TypeError( "a request must be a JSON object" )
+                old = request.pop( "old" )
+                new = request.pop( "new" )
+                response = { "hunks": [ hunk._asdict() for hunk in tol_diff( old, new, **request ) ] }
+            except Exception as error:
+                response = { "error": "{:s}: {:s}".format( type(error).__name__, str(error) ) }
+            self.wfile.write( (json.dumps( response ) + "\n").encode() )
+            self.wfile.flush()
+
+def serve(socketPath):
+    '''
+    Answer tol_diff() requests on the Unix socket socketPath until interrupted
+    or terminated.
+    Each connection is handled in a forked process.
+    '''
+    if ( not hasattr(socket, "AF_UNIX") or not hasattr(socketserver, "ForkingMixIn") ):
+        raise OSError( "the server mode needs Unix sockets and fork(), which this platform does not have" )
+
+    class ToleranceDiffServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    # Replace the socket of a previous server, never any other file
+    if ( os.path.exists(socketPath) ):
+        if ( not stat.S_ISSOCK( os.stat(socketPath).st_mode ) ):
+            raise OSError( "{:s} exists and is not a socket".format( socketPath ) )
+        os.remove( socketPath )
+    signal.signal( signal.SIGTERM, signal.default_int_handler )    # Terminate as if interrupted
+    server = ToleranceDiffServer( socketPath, ToleranceDiffHandler )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove( socketPath )
+
+def serverRequest(socketPath, old, new, **options):
+    '''
+    Send one tol_diff() request to the server on socketPath. Returns the list
+    of DiffHunks. Raises RuntimeError with the message of a server error.
+    '''
+    request = dict( options, old=old, new=new )
+    client = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        client.connect( socketPath )
+        client.sendall( (json.dumps( request ) + "\n").encode() )
+        response = json.loads( client.makefile("rb").readline() )
+    finally:
+        client.close()
+    if ( "error" in response ): raise RuntimeError( response["error"] )
+    return [ DiffHunk( hunk["oldStart"], hunk["oldStop"], hunk["newStart"], hunk["newStop"],
+                       [ tuple(line) for line in hunk["oldLines"] ], [ tuple(line) for line in hunk["newLines"] ] )
+             for hunk in response["hunks"] ]
+
+################################
+# End library API and server functions
+################################
 
 ################################
 # Define the main function
@@ -168,14 +2186,27 @@ def main():
     # Parse command line arguments
     ################################
     parser = argparse.ArgumentParser()
-    parser.add_argument( "OldFile", help="Old or reference text output file from a program containing text and numerical values." )
-    parser.add_argument( "NewFile", help="New or changed text output file from a program containing text and numerical values." )
+    parser.add_argument( "OldFile", nargs="?", help="Old or reference text output file from a program containing text and numerical values. A directory for batch mode." )
+    parser.add_argument( "NewFile", nargs="?", help="New or changed text output file from a program containing text and numerical values. A directory for batch mode." )
+    parser.add_argument( "-S","--server", help="Server mode: answer comparison requests on this local Unix socket until interrupted", action="store" )
+    parser.add_argument( "-M","--manifest", help="Batch mode: file listing pairs of old and new files, one pair per line, each optionally followed by tolerance options", action="store" )
     parser.add_argument( "-d","--debug", help="Print debugging information to stdout.", action="store_true" )
+    parser.add_argument( "-T","--stats", help="Write the time of each phase, counters and peak memory as JSON to this file, or to stderr if no file is given", action="store", nargs="?", const="-" )
     parser.add_argument( "-t","--defaultTolerances", help="FSets default absolute and relative tolerances to 1.E-15 and 1.E-8, respectively", action="store_true" )
     parser.add_argument( "-a","--absolute", help="Absolute tolerance value. Default is 0.0, overrides default tolerances", action="store" )
     parser.add_argument( "-r","--relative", help="Relative tolerance value. Default is 0.0, overrides default tolerances", action="store" )
-    parser.add_argument( "-f","--file", help="Name of the output file. Default is stdout", action="store" )
+    parser.add_argument( "-f","--file", help="Name of the output file, compressed if it ends with .gz, .bz2 or .xz. Default is stdout", action="store" )
     parser.add_argument( "-i","--integers", help="Flag indicating integers are also checked", action="store_true" )
+    parser.add_argument( "-q","--brief","--quiet", help="Only report whether the files differ, stopping at the first diff section. Exit status is 0 if they do not differ, 1 if they do and 2 on errors", action="store_true" )
+    parser.add_argument( "-n","--maxDiffs", help="Stop after this many diff sections are written", action="store", type=int )
+    parser.add_argument( "-Q","--quantize", help="Match lines equal within the tolerances in the diff itself, by quantized numeric keys. Needs tolerances", action="store_true" )
+    parser.add_argument( "-x","--ignoreRegex", help="Remove the lines matching this regular expression from both files before diffing. Can be repeated", action="append", default=[] )
+    parser.add_argument( "-X","--ignoreFile", help="File of regular expressions, one per line, of lines to remove before diffing. Can be repeated", action="append", default=[] )
+    parser.add_argument( "-s","--stream", help="Read and diff the files in windows of bounded memory, for files too large to read at once", action="store_true" )
+    parser.add_argument( "-m","--memoryCap", help="Approximate memory in MB for the windows of both files in --stream mode. Default is 256", action="store", type=float, default=256.0 )
+    parser.add_argument( "-j","--jobs", help="Number of worker processes to diff the files, or the pairs of files in batch mode, in parallel. Default is 1", action="store", type=int, default=1 )
+    parser.add_argument( "-b","--backend", help="Tolerance comparison backend. Default is auto, which uses numpy for large diff sections when it is installed", choices=toleranceBackends, default="auto" )
+    parser.add_argument( "-g","--algorithm", help="Diff algorithm. Default is myers, reference is the original slow algorithm kept for output checks", choices=sorted(diffAlgorithms), default="myers" )
     args = parser.parse_args()
 
     # Get cwd
@@ -188,87 +2219,99 @@ def main():
     else:
         debug=False
 
+    # Start the run statistics first so they cover the whole run
+    global stats
+    if ( args.stats ): stats = RunStats()
+
     # Initialize input error counter
     ErrorNum = 0
 
-    # Get text file names and error check
+    # Get text file names and error check. Two directories or a manifest file select batch mode.
     oldFile = args.OldFile
-    if ( not os.path.exists(oldFile) ):
-        print( "ERROR: {0:s} does not exist.".format(oldFile) )
+    newFile = args.NewFile
+    batch = False
+    if ( args.server ):
+        pass
+    elif ( args.manifest ):
+        batch = True
+        if ( not os.path.exists(args.manifest) ):
+            print( "ERROR: {0:s} does not exist.".format(args.manifest) )
+            ErrorNum += 1
+    elif ( oldFile is None or newFile is None ):
+        print( "ERROR: OldFile and NewFile are required unless --manifest or --server is given." )
         ErrorNum += 1
+    else:
+        if ( not os.path.exists(oldFile) ):
+            print( "ERROR: {0:s} does not exist.".format(oldFile) )
+            ErrorNum += 1
+        if ( not os.path.exists(newFile) ):
+            print( "ERROR: {0:s} does not exist.".format(newFile) )
+            ErrorNum += 1
+        if ( os.path.isdir(oldFile) and os.path.isdir(newFile) ):
+            batch = True
+        elif ( os.path.isdir(oldFile) or os.path.isdir(newFile) ):
+            print( "ERROR: OldFile and NewFile must both be files or both be directories." )
+            ErrorNum += 1
+
+    # Get tolerances, None if no tolerances are set
+    tolerances = getTolerances( args.defaultTolerances, args.absolute, args.relative, args.integers )
+    noTol = ( tolerances is None )
+    absTol, relTol, intTol = tolerances if tolerances else ( 0.0, 0.0, args.integers )
+    if ( debug ):
+        print( "main::tolerances: ",tolerances )
 
-    newFile = args.NewFile
-    if ( not os.path.exists(newFile) ):
-        print( "ERROR: {0:s} does not exist.".format(newFile) )
+    # Get tolerance comparison backend
+    backend = args.backend
+    if ( backend == "numpy" and numpy is None ):
+        print( "ERROR: the numpy backend requires NumPy, which is not installed." )
         ErrorNum += 1
 
-    # If no tolerances specified, these will be the default
-    noTol = True
-    absTol = 0.0
-    relTol = 0.0
-
-    # Check for default tolerance flag
-    defaultTolerances = False
-#    if ( args.defaultTolerances ): defaultTolerances = True
-    if ( args.defaultTolerances ):
-        defaultTolerances = True
-        noTol = False
-        absTol = 1.E-15
-        relTol = 1.E-8
-        if ( debug ):  print( "main::setting default tolerances" )
-    if ( debug ):
-        print( "main::defaultTolerances: ",defaultTolerances )
-        print( "main::absTol: ",absTol )
-        print( "main::relTol: ",relTol )
+    # Quantized matching needs tolerances to quantize by
+    if ( args.quantize and noTol ):
+        print( "ERROR: --quantize needs tolerances, set with -t, -a or -r." )
+        ErrorNum += 1
 
-    # Get Integer flag
-    if ( args.integers ):
-        intTol = True
-    else:
-        intTol = False
+    # Compile the ignore rules into one regular expression
+    ignorePattern = None
+    try:
+        ignorePattern = compileIgnoreRules( args.ignoreRegex, args.ignoreFile )
+    except (IOError, OSError, re.error) as error:
+        print( "ERROR: ignore rules: {:s}".format( str(error) ) )
+        ErrorNum += 1
+
+    # Get number of parallel jobs
+    if ( args.jobs < 1 ):
+        print( "ERROR: --jobs must be at least 1." )
+        ErrorNum += 1
+    if ( args.jobs > 1 and args.stream and not batch ):
+        print( "ERROR: --jobs and --stream cannot be used together." )
+        ErrorNum += 1
+
+    # Get memory cap of the stream windows
+    if ( not (args.memoryCap > 0.0 and math.isfinite(args.memoryCap)) ):
+        print( "ERROR: --memoryCap must be a number of MB greater than 0." )
+        ErrorNum += 1
+
+    # Get limit on the diff sections written
+    if ( args.maxDiffs is not None and args.maxDiffs < 1 ):
+        print( "ERROR: --maxDiffs must be at least 1." )
+        ErrorNum += 1
 
     # Get output file name and open either file set handle to sys.stdout
+    diffFile = sys.stdout
     if ( args.file ):
         diffFileName = args.file
-        diffFile = open( diffFileName,'w' )
-    else:
-        diffFile = sys.stdout
-
-    # Get Absolute tolerance value, no default set in argparse so it won't override any existing values
-    absTolSet = False
-    if ( args.absolute ):
-        absTol = args.absolute
-        absTolSet = True
-        noTol = False
-    if ( debug ):
-        print( "main::After check of args.absolute" )
-        print( "main::absTol: ",absTol )
-        print( "main::relTol: ",relTol )
-
-    # Get Absolute tolerance value, no default set in argparse so it won't override any existing values
-    relTolSet = False
-    if ( args.relative ):
-        relTol = args.relative
-        relTolSet = True
-        noTol = False
-    if ( debug ):
-        print( "main::After check of args.relative" )
-        print( "main::absTol: ",absTol )
-        print( "main::relTol: ",relTol )
+        try:
+            diffFile = openOutput( diffFileName )
+        except (IOError, OSError) as error:
+            print( "ERROR: {:s}".format( str(error) ) )
+            ErrorNum += 1
 
-    # Convert toleraces to floats
-    absTol = float(absTol)
-    relTol = float(relTol)
-    if ( debug ):
-        print( "main::After tolerance conversion to floats" )
-        print( "main::absTol: ",absTol )
-        print( "main::relTol: ",relTol )
-
-    # Report input errors and exit
+    # Report input errors and exit, with status 2 in brief mode where 1 means the files differ
     if ( ErrorNum > 0 ):
         print( "\nErrors detected in input." )
         ErrorNum += 1
-        exit(ErrorNum)
+        exit( 2 if args.brief else ErrorNum )
 
     # Set and print script version
     numDiffVer = "0.1.0"
@@ -284,196 +2327,79 @@ def main():
     if ( debug ):
         sys.stdout.write( "\n")
         sys.stdout.write( "main::Input and flags:\n")
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Old text file:", oldFile ) )
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::New text file:", newFile ) )
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Default tolerance option:", str(defaultTolerances) ) )
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Absolute tolerance reset:", str(absTolSet) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Old text file:", str(oldFile) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::New text file:", str(newFile) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Manifest file:", str(args.manifest) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Default tolerance option:", str(args.defaultTolerances) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Absolute tolerance reset:", str(bool(args.absolute)) ) )
         sys.stdout.write( "  {:35s} {:<12.4e}\n".format( "main::Absolute tolerance:", absTol ) )
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Relative tolerance reset:", str(relTolSet) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Relative tolerance reset:", str(bool(args.relative)) ) )
         sys.stdout.write( "  {:35s} {:<12.4e}\n".format( "main::Relative tolerance:", relTol ) )
         sys.stdout.write( "  {:35s} {:s}\n".format( "main::Integer option:", str(intTol) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Diff algorithm:", args.algorithm ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Tolerance backend:", backend ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Quantize option:", str(args.quantize) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Ignore pattern:", str(ignorePattern.pattern if ignorePattern else None) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Brief option:", str(args.brief) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Maximum diff sections:", str(args.maxDiffs) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Stream option:", str(args.stream) ) )
+        sys.stdout.write( "  {:35s} {:d}\n".format( "main::Parallel jobs:", args.jobs ) )
+        sys.stdout.write( "  {:35s} {:<12.4e}\n".format( "main::Memory cap (MB):", args.memoryCap ) )
         sys.stdout.write( "  {:35s} {:s}\n".format( "main::noTol:", str(noTol) ) )
         sys.stdout.write( "  {:35s} {:s}\n".format( "main::Debug option:", str(debug) ) )
-        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Diff File name:", diffFileName ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Stats file:", str(args.stats) ) )
+        sys.stdout.write( "  {:35s} {:s}\n".format( "main::Diff File name:", str(args.file) ) )
 
 
     # NOTE: Python 3 requires the function form of print: print().
     #       Python 2 will work with the function form but will print the parentheses.
 
     ################################
-    # Read input text files, removing newlines as you go
+    # Server mode answers requests until interrupted
     ################################
-    oldfile = open(oldFile,"r")
-    with open(oldFile) as oldf:
-        oldTextLines = [ line.rstrip('\n') for line in oldf.readlines() ]
-    newfile = open(newFile,"r")
-    with open(newFile) as newf:
-        newTextLines = [ line.rstrip('\n') for line in newf.readlines() ]
-    oldfile.close()
-    newfile.close()
-
-    ################################
-    # Diff the files
-    ################################
-    diffList = get_diff( oldTextLines, newTextLines )
-    if ( debug ):
-        print ( "\nmain::diffList:" )
-        for line in diffList:
-            sys.stdout.write( line + "\n" )
-
-    # If there are no tolerances set just write the diff
-    if ( noTol ):
-        for line in diffList:
-            diffFile.write( line + "\n" )
-        if diffFile is not sys.stdout: diffFile.close()
+    if ( args.server ):
+        try:
+            serve( args.server )
+        except OSError as error:
+            print( "ERROR: {:s}".format( str(error) ) )
+            exit(2)
         exit()
 
     ################################
-    # Process the diffs
+    # Batch mode writes one report for all pairs and exits with their aggregate status
     ################################
-
-    # Count the diff sections
-    nDiffSections = 0
-    newSection = False
-    sectionLineNumbers = []
-
-    iLine = 0
-    while iLine < len(diffList):
-#    for iLine in range( len(diffList) ):  # Maybe this should be a while loop since changing iLine in loop???
-
-        if ( debug ): print( "\n\nmain::diffList[{:d}]:{:s}".format( iLine,diffList[iLine] ) )
-
-        if ( isInteger(diffList[iLine][0]) ):    # New diff sections begin with an integer in the first column
-
-            if ( debug ):
-                print( "+++++++++++++++++++++++ Found section separator ++++++++++++++++++++++++" )
-                print( " main::diffList[{:d}]:{:s}".format( iLine,diffList[iLine] ) )
-
-            nDiffSections += 1
-            sectionLineNumbers.append( iLine )
-            newSection = True
-
-            # process the diff section header
-            temp = re.split( "c|,", diffList[iLine] ) # split text at lowercase c and comma
-            iStartOld,iStopOld,numLinesOld,iStartNew,iStopNew,numLinesNew = processSectionHeader( temp )
-
+    maxBytes = int( args.memoryCap * 1024 * 1024 )
+    if ( batch ):
+        if ( args.manifest ):
+            pairs = readManifest( args.manifest, tolerances )
         else:
+            pairs = batchTreePairs( oldFile, newFile, tolerances )
+        status = batchDiff( diffFile, pairs, args.jobs, algorithm=args.algorithm, backend=backend,
+                            stream=args.stream, maxBytes=maxBytes, maxHunks=args.maxDiffs, brief=args.brief,
+                            quantize=args.quantize, ignorePattern=ignorePattern )
+        if diffFile is not sys.stdout: diffFile.close()
+        if ( stats is not None ): writeStats( args.stats )
+        exit(status)
 
-            if ( newSection ):
-
-                ################################
-                # Process an entire diff section
-                ################################
-
-                newSection = False
-                # Extract the old and new parts of this diff section
-                if ( debug ):
-                    print( " main::Section {:d}".format( nDiffSections ) )
-                    print( "   main::Old file section" )
-                    print( "   main::firstOldDiffLine:",diffList[iLine] )
-                oldDiffSection = diffList[iLine:iLine+numLinesOld]
-                if ( debug ):
-                    for line in oldDiffSection:
-                        print( "   main::OldDiffSection:",line )
-
-                # Move to the new file part of this section
-                iLine += (numLinesOld + 1)  # The plus one is to skip the separator between old and new diffs
-                if ( debug ):
-                    print( "   main::New file section" )
-                    print( "   main::firstNewDiffLine:",diffList[iLine] )
-                newDiffSection = diffList[iLine:iLine+numLinesNew]
-                if ( debug ):
-                    for line in newDiffSection:
-                        print( "   main::NewDiffSection:",line )
-
-                # Process the extracted diff sections
-                for iOldLine in range( len(oldDiffSection) ):    # for each line in oldDiffSection compare to each line in newDiffSection
-                    oldLine = oldDiffSection[iOldLine]
-                    oldLineSplit = oldLine.split()[1:] # remove leading angle brackets
-                    if ( debug ): print( "      main::oldLineSplit:", oldLineSplit )
-                    oldFields = len(oldLineSplit)
-                    for iNewLine in range( len(newDiffSection) ):
-                        if ( newDiffSection[iNewLine][0:9] == "xxREMOVExx" ): continue # This line already determined same w/in tolerances and removed
-                        newLine = newDiffSection[iNewLine]
-                        isLineDiff = False
-                        if ( debug ): print( "         main::isLineDiff:", isLineDiff )
-                        newLineSplit = newLine.split()[1:] # remove leading angle brackets
-                        if ( debug ): print( "         main::oldLineSplit:", oldLineSplit )
-                        newFields = len(newLineSplit)
-                        if ( not (oldFields == newFields) ):   # Different number of fields --> true diff; check next new line
-                            isLineDiff = True # not necessary
-                            if ( debug ): print( "      main::number of fields NOT equal, isLineDiff", isLineDiff )
-                            continue      # to next newLine
-                        else:                                          # Same number of fields, so check fields
-                            if ( debug ): print( "         main::number of fields equal, isLineDiff", isLineDiff )
-                            for oldField,newField in zip(oldLineSplit,newLineSplit):             # Check each field for equality
-                                if ( debug ): print ( "         main::oldField,newField:", oldField, newField )
-#                                if ( not (oldField == newField) ):  # Fields are not equal, check if they are floating point numbers (integers would be equal)
-                                if ( oldField != newField ):  # Fields are not equal, check if they are floating point numbers (integers would be equal)
-                                    isNum = False
-                                    if ( intTol ):
-                                        isNum = ( isNumber(oldField) and isNumber(newField) )
-                                    else:
-                                        isNum = ( isFloat(oldField) and isFloat(newField) )
-                                    if ( debug ): print( "         main::isNum", isNum )
-                                    if ( not isNum ):
-                                        isLineDiff = True
-                                        if ( debug ): print( "         main::Both NOT numbers, isLineDiff:",isLineDiff )
-                                    else:    # Both fields are numbers so do a tolerance check
-                                        if ( debug ): print( "         main::Both ARE numbers, isLineDiff:",isLineDiff )
-                                        # diffFlag is True if differences, False if within tolerances
-                                        diffFlag = ( not math.isclose( float(oldField), float(newField), abs_tol=absTol, rel_tol=relTol ) )
-                                        if ( debug ): print( "         main::diffFlag: ",diffFlag )
-                                        if ( not diffFlag ): continue # on to next set of fields
-                                        isLineDiff = True
-                                        if ( debug ): print( "         main::isLineDiff", isLineDiff )
-
-                        if ( debug ): print( "      main::isLineDiff:", isLineDiff )
-                        if ( isLineDiff ): continue # to next newLine
-                        # If not a line diff mark both old and new for removal and break back to oldLine loop
-                        if ( debug ): print( "      main:: Not a difference" )
-                        if ( debug ):
-                            print( "   main::Found lines w/in tolerances." )
-                            print( "   main::Removing: ",oldDiffSection[iOldLine] )
-                            print( "   main::Removing: ",newDiffSection[iNewLine] )
-                        oldDiffSection[iOldLine] = "xxREMOVExx"+oldDiffSection[iOldLine]
-                        newDiffSection[iOldLine] = "xxREMOVExx"+newDiffSection[iNewLine]
-                        break # out of newLine loop to next oldLine
-
-                # Process Old Diff Section to remove lines w/in tolerances
-                if ( debug ): print( "   main::Processed Old file section" )
-                processedOldDiffSection = processDiffSectionRemovals(oldDiffSection,"xxREMOVExx")
-
-                # Process New Diff Section to remove lines w/in tolerances
-                if ( debug ): print( "   main::Processed New file section" )
-                processedNewDiffSection = processDiffSectionRemovals(newDiffSection,"xxREMOVExx")
-
-                # Write processed Old Diff Section
-                if ( len(processedOldDiffSection) > 0 ):
-                    diffFile.write( "********* Around line {:d}\n".format( iStartOld ) )
-                    for line in processedOldDiffSection: diffFile.write( line  + "\n" )
-
-                # Write processed New Diff Section
-                if ( len(processedNewDiffSection) > 0 ):
-                    diffFile.write( "--------- Around line {:d}\n".format( iStartNew ) )
-                    for line in processedNewDiffSection: diffFile.write( line + "\n" )
-
-                # Move to end of new diff section
-                iLine += (numLinesNew - 1) # only to ending line of new section, last line of while loop will also increment
-
-        ################################
-        # End of diff section processing
-        ################################
-
-
-        iLine += 1  # increment iLine
     ################################
-    # End of diff processing
+    # Diff the files and write the diffs, subject to tolerances if any are set
     ################################
-
-    if ( debug ):
-        print( "\nmain::nDiffSections = {:d}".format( nDiffSections ) )
-        print( sectionLineNumbers )
+    try:
+        nDiffSections = diffFiles( oldFile, newFile, diffFile, tolerances, args.algorithm, backend,
+                                   args.stream, maxBytes, args.jobs, args.maxDiffs, args.brief,
+                                   args.quantize, ignorePattern )
+    except (IOError, OSError, UnicodeDecodeError, ValueError) + compressionErrors as error:
+        print( "ERROR: {:s}".format( str(error) ) )
+        exit(2)
+
+    if ( debug ): print( "\nmain::nDiffSections = {:d}".format( nDiffSections ) )
+    if ( stats is not None ): writeStats( args.stats )
+
+    # Brief mode reports the verdict and exits with it
+    if ( args.brief ):
+        if ( nDiffSections > 0 ): diffFile.write( "Files {:s} and {:s} differ\n".format( oldFile, newFile ) )
+        if diffFile is not sys.stdout: diffFile.close()
+        exit( 1 if nDiffSections > 0 else 0 )
 
     if diffFile is not sys.stdout: diffFile.close()
 